@@ -0,0 +1,421 @@
+import video_games as vg
+import video_games_access as vga
+import video_games_batch as vgb
+import video_games_benchmark as vgbm
+import video_games_query as vgq
+import video_games_server as vgs
+import video_games_pipeline as vgp
+
+import os
+import json
+import pytest
+import asyncio
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# a small synthetic csv file in its own directory, the batch runs every csv file of a directory
+def write_games_csv(directory, rows=300, seed=12):
+    os.makedirs(directory, exist_ok=True)
+    file_name = os.path.join(directory, "games.csv")
+    vgbm.generate_video_games_csv(file_name, rows, seed)
+    return file_name
+
+# # # # # # # # # # # #
+#   BATCH             #
+# # # # # # # # # # # #
+
+# the second batch hits the cache filled by the first one, and still writes the cleaned csv and xlsx of its own jobs
+def test_batch_twice_into_two_output_directories(tmp_path, monkeypatch):
+    # the forked workers see the cache directory of the test
+    monkeypatch.setattr(vg, 'CACHE_DIRECTORY', str(tmp_path / "cache"))
+    source = tmp_path / "source"
+    write_games_csv(source)
+    for output_directory in [tmp_path / "first", tmp_path / "second"]:
+        summary = vgb.run_video_games_batch(str(source), str(output_directory), workers=1, text_only=True, export_xlsx=True)
+        assert not summary['jobs'][str(source / "games.csv")].get('failed')
+        assert os.path.isfile(output_directory / "games" / "csv" / "games_cleaned.csv")
+        assert os.path.isfile(output_directory / "games" / "xlsx" / "games_cleaned.xlsx")
+    first_csv = (tmp_path / "first" / "games" / "csv" / "games_cleaned.csv").read_bytes()
+    assert (tmp_path / "second" / "games" / "csv" / "games_cleaned.csv").read_bytes() == first_csv
+
+# # # # # # # # # # # #
+#   COLUMNAR STORE    #
+# # # # # # # # # # # #
+
+# a run with the columnar store after a run without it builds the store from the feather cache, and the next
+# run counts and builds the cross analysis from the store with the same report and cleaned csv
+def test_columnar_store_is_built_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(vg, 'CACHE_DIRECTORY', str(tmp_path / "cache"))
+    file_name = write_games_csv(tmp_path / "source", seed=24)
+    store_directory = vg.get_columnar_store_directory(vg.get_cache_file(file_name))
+    runs = [('cold', {'cross_analysis': True}), ('cache', {'columnar_store': True, 'cross_analysis': True}),
+            ('store', {'columnar_store': True, 'cross_analysis': True, 'export_xlsx': True})]
+    for run, options in runs:
+        vga.run_video_games_access(file_name, output_directory=str(tmp_path / run), text_only=True, **options)
+        if run == 'cache':
+            assert os.path.isdir(store_directory)
+    for run, _ in runs[1:]:
+        for directory, extension in [("txt", "txt"), ("ndjson", "ndjson"), ("csv", "csv")]:
+            name = "games_cleaned" if directory == "csv" else "games"
+            assert (tmp_path / run / directory / f"{name}.{extension}").read_bytes() == (tmp_path / "cold" / directory / f"{name}.{extension}").read_bytes()
+    assert os.path.isfile(tmp_path / "store" / "xlsx" / "games_cleaned.xlsx")
+    with open(tmp_path / "store" / "log" / "games_stages.json") as stages_file:
+        assert 'store cube dimensions' in [stage['stage'] for stage in json.load(stages_file)['stages']]
+    assert "genres by platform:" in (tmp_path / "store" / "txt" / "games.txt").read_text()
+
+# # # # # # # # # # # #
+#   PARALLEL CLEANING #
+# # # # # # # # # # # #
+
+# the rows cleaned by two workers are the rows cleaned here, with the arrow files in a given directory or, when it
+# doesn't exist, in the temporary directory of the system, and no arrow file is left behind
+def test_parallel_cleaning_falls_back_to_disk(tmp_path):
+    file_name = write_games_csv(tmp_path / "source", seed=23)
+    df = vg.pd.read_csv(file_name, dtype=vg.CSV_DTYPES)
+    cleaned = df.copy()
+    missing_values = vg.clean_rows(cleaned)
+    for shared_memory_directory in [tmp_path / "shared", tmp_path / "missing"]:
+        os.makedirs(tmp_path / "shared", exist_ok=True)
+        parallel, parallel_missing_values = vg.clean_in_parallel(df.copy(), 2, str(shared_memory_directory))
+        # the platforms come back from arrow as strings rather than objects
+        vg.pd.testing.assert_frame_equal(parallel, cleaned, check_dtype=False)
+        assert parallel_missing_values.equals(missing_values)
+        assert not os.listdir(tmp_path / "shared")
+
+# # # # # # # # # # # #
+#   OUT OF CORE       #
+# # # # # # # # # # # #
+
+# the lines of a txt report, without the memory usage that the chunked modes add up chunk by chunk
+def report_lines(txt_file):
+    return [line for line in txt_file.read_text().splitlines() if not line.startswith("memory usage:")]
+
+# with chunks smaller than the csv file, the out of core and chunked modes write the same report and cleaned csv as in
+# memory, the out of core mode spilling the rows to several partitions
+def test_chunked_modes_match_in_memory(tmp_path, monkeypatch):
+    file_name = write_games_csv(tmp_path / "source", rows=1000, seed=20)
+    monkeypatch.setattr(vg, 'OUT_OF_CORE_PARTITION_BYTES', os.path.getsize(file_name) // 8)
+    runs = [('memory', {'use_cache': False}), ('out of core', {'out_of_core': True, 'chunksize': 97}), ('chunks', {'chunksize': 97})]
+    for run, options in runs:
+        vga.run_video_games_access(file_name, output_directory=str(tmp_path / run), text_only=True, **options)
+    memory = tmp_path / "memory"
+    for run, _ in runs[1:]:
+        assert report_lines(tmp_path / run / "txt" / "games.txt") == report_lines(memory / "txt" / "games.txt")
+        assert (tmp_path / run / "ndjson" / "games.ndjson").read_bytes() == (memory / "ndjson" / "games.ndjson").read_bytes()
+        assert (tmp_path / run / "csv" / "games_cleaned.csv").read_bytes() == (memory / "csv" / "games_cleaned.csv").read_bytes()
+
+# # # # # # # # # # # #
+#   INCREMENTAL       #
+# # # # # # # # # # # #
+
+# one run of the incremental mode on file_name, the state saved in between like the access script does
+def incremental_run(file_name, state_file, cleaned_csv):
+    state = vg.load_incremental_state(state_file)
+    new_rows = vg.append_new_rows(state, file_name, cleaned_csv, chunksize=64)
+    vg.save_incremental_state(state, state_file)
+    return state, new_rows
+
+# the csv file holding only the first rows of another one
+def write_first_rows(source, file_name, rows):
+    with open(source) as source_csv:
+        lines = source_csv.readlines()
+    with open(file_name, "w") as csv_file:
+        csv_file.writelines(lines[:rows + 1])
+    return lines
+
+# the rows appended since the last run are the only ones cleaned, and the result is the same as one run on the whole file
+def test_incremental_appends_the_new_rows(tmp_path):
+    source = write_games_csv(tmp_path / "source")
+    whole_state, whole_rows = incremental_run(source, str(tmp_path / "whole" / "state.json"), str(tmp_path / "whole.csv"))
+
+    file_name = str(tmp_path / "games.csv")
+    lines = write_first_rows(source, file_name, 200)
+    state_file, cleaned_csv = str(tmp_path / "state" / "state.json"), str(tmp_path / "games_cleaned.csv")
+    _, first_rows = incremental_run(file_name, state_file, cleaned_csv)
+    with open(file_name, "a") as csv_file:
+        csv_file.writelines(lines[201:])
+    state, appended_rows = incremental_run(file_name, state_file, cleaned_csv)
+
+    assert 0 < first_rows and 0 < appended_rows
+    assert first_rows + appended_rows == whole_rows
+    assert state['consumed bytes'] == os.path.getsize(file_name)
+    assert state['removed rows'] == whole_state['removed rows'] and whole_state['removed rows']['exact row'] > 0
+    assert (tmp_path / "games_cleaned.csv").read_bytes() == (tmp_path / "whole.csv").read_bytes()
+    _, no_rows = incremental_run(file_name, state_file, cleaned_csv)
+    assert no_rows == 0
+
+# a csv file whose rows read before changed is cleaned again from its first row
+def test_incremental_starts_over_when_the_file_is_rewritten(tmp_path):
+    file_name = write_games_csv(tmp_path / "source", seed=7)
+    state_file, cleaned_csv = str(tmp_path / "state" / "state.json"), str(tmp_path / "games_cleaned.csv")
+    incremental_run(file_name, state_file, cleaned_csv)
+
+    vgbm.generate_video_games_csv(file_name, 320, 8)
+    _, rewritten_rows = incremental_run(file_name, state_file, cleaned_csv)
+    _, fresh_rows = incremental_run(file_name, str(tmp_path / "fresh" / "state.json"), str(tmp_path / "fresh.csv"))
+
+    assert rewritten_rows == fresh_rows
+    assert (tmp_path / "games_cleaned.csv").read_bytes() == (tmp_path / "fresh.csv").read_bytes()
+
+# # # # # # # # # # # #
+#   DUPLICATES        #
+# # # # # # # # # # # #
+
+# distinct games of the kaggle dataset whose titles are alike, none of them is a duplicate of the other
+DISTINCT_TITLE_PAIRS = [
+    ('Mega Man Battle Network 6 Cybeast Gregar', 'Mega Man Battle Network 6 Cybeast Falzar'),
+    ('Pokemon Mystery Dungeon: Red Rescue Team', 'Pokemon Mystery Dungeon: Blue Rescue Team'),
+    ('Picross e', 'Picross e2'),
+    ('Picross e2', 'Picross e3'),
+    ('Penny Arcade Adventures: Episode One', 'Penny Arcade Adventures: Episode Two'),
+    ('Hatsune Miku: Project DIVA F', 'Hatsune Miku: Project DIVA F 2nd'),
+    ('Snipperclips', 'Snipperclips Plus'),
+    ('FIFA 21', 'FIFA 22'),
+]
+
+# the same game listed twice, the titles only differ by case, punctuation and edition tags
+SAME_TITLE_PAIRS = [
+    ('The Witcher 3: Wild Hunt', 'the witcher 3 - wild hunt'),
+    ('Skyrim', 'Skyrim Special Edition'),
+    ('Dark Souls Remastered', 'Dark Souls'),
+    ('Okami HD', 'Okami'),
+    ('Fallout 3 Game of the Year Edition', 'Fallout 3'),
+]
+
+# the games left by the near duplicate rules, every pair by the same developer in the same year
+def near_duplicates_left(title_pairs):
+    df = vg.pd.DataFrame({
+        'Title': [title for pair in title_pairs for title in pair],
+        'Release Date': '11/14/2006',
+        'Developer': [f"Developer {index}" for index, pair in enumerate(title_pairs) for _ in pair],
+    })
+    vg.drop_duplicate_games(df, near_duplicates=True)
+    return df['Title'].tolist()
+
+def test_near_duplicates_keep_distinct_games():
+    for pair in DISTINCT_TITLE_PAIRS:
+        assert near_duplicates_left([pair]) == list(pair)
+
+def test_near_duplicates_remove_edition_tags():
+    assert near_duplicates_left(SAME_TITLE_PAIRS) == [title for title, _ in SAME_TITLE_PAIRS]
+
+# # # # # # # # # # # #
+#   SKETCHES          #
+# # # # # # # # # # # #
+
+# many values seen a few times and a few values seen often, split into partitions like the chunks of different processes
+def sketched_partitions(partitions=4, seed=22):
+    rng = vg.np.random.default_rng(seed)
+    common = [f"Common {number}" for number in range(5)]
+    values = vg.pd.Series(rng.permutation([f"Rare {number}" for number in rng.integers(0, 6000, 20000)] + common * 800))
+    boundaries = vg.np.linspace(0, len(values), partitions + 1).astype('int64')
+    return values, [vg.sketch_values(values.iloc[start:stop]) for start, stop in zip(boundaries[:-1], boundaries[1:])]
+
+# the count-min counters and hyperloglog registers merged from partitions, in any order, are those of one sketch of every value
+def test_merged_sketches_equal_one_sketch():
+    values, sketches = sketched_partitions()
+    whole = vg.sketch_values(values)
+    for ordered in [sketches, sketches[::-1]]:
+        merged = vg.new_sketch()
+        for sketch in ordered:
+            merged = vg.merge_sketches(merged, sketch)
+        assert merged['games'] == whole['games'] == len(values)
+        assert (merged['count min'] == whole['count min']).all()
+        assert (merged['hyperloglog'] == whole['hyperloglog']).all()
+
+# the merged sketch keeps its error bounds: every common value is a heavy hitter, the counts are never under the true
+# counts nor over by more than the bound, and the distinct values are within a few standard errors
+def test_merged_sketches_keep_their_bounds():
+    values, sketches = sketched_partitions()
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged = vg.merge_sketches(merged, sketch)
+    value_counts = values.value_counts()
+    bounds = vg.sketch_bounds({'Developer': merged})['Developer']
+
+    assert set(value_counts[value_counts > bounds['listed above']].index) <= set(merged['heavy hitters'].index)
+    estimates = vg.count_min_estimate(merged, value_counts.index)
+    assert (estimates >= value_counts.to_numpy()).all()
+    assert (estimates - value_counts.to_numpy()).max() <= bounds['count error']
+    assert abs(bounds['distinct values'] - len(value_counts)) <= 4 * vg.HYPERLOGLOG_ERROR * len(value_counts)
+
+# # # # # # # # # # # #
+#   QUERIES           #
+# # # # # # # # # # # #
+
+# the cleaned csv of a small synthetic csv file
+def write_cleaned_csv(tmp_path):
+    file_name = write_games_csv(tmp_path / "source", seed=16)
+    vga.run_video_games_access(file_name, output_directory=str(tmp_path / "output"), text_only=True, use_cache=False)
+    return str(tmp_path / "output" / "csv" / "games_cleaned.csv")
+
+# the indexed lookups return the same games as a scan of the whole cleaned csv
+def test_query_games_matches_a_scan(tmp_path):
+    query_index = vgq.load_query_index(write_cleaned_csv(tmp_path))
+    games = query_index['games']
+    release_dates = vg.pd.to_datetime(games['Release Date'], format=vg.RELEASE_DATE_FORMAT)
+    developer, platforms = games['Developer'].iloc[0], games['Platform'].unique()[:2].tolist()
+    title_prefix = games['Title'].iloc[3][:2].upper()
+
+    queries = [
+        ({'developer': developer}, games['Developer'] == developer),
+        ({'platform': platforms, 'released_from': '2010-01-01', 'released_to': '2015-12-31'},
+         games['Platform'].isin(platforms) & release_dates.between('2010-01-01', '2015-12-31')),
+        ({'title_prefix': title_prefix}, games['Title'].str.casefold().str.startswith(title_prefix.casefold())),
+        ({'developer': 'No Such Developer'}, games['Developer'] == 'No Such Developer'),
+    ]
+    for criteria, mask in queries:
+        assert vgq.query_games(query_index, **criteria).equals(games[mask])
+    assert len(vgq.query_games(query_index, platform=platforms, limit=3)) == 3
+
+# the command line prints the matching games and fails when there are none
+def test_query_command_line(tmp_path):
+    cleaned_csv = write_cleaned_csv(tmp_path)
+    developer = vg.pd.read_csv(cleaned_csv)['Developer'].iloc[0]
+    script = os.path.join(os.path.dirname(os.path.abspath(vgq.__file__)), "video_games_query.py")
+
+    found = subprocess.run([sys.executable, script, cleaned_csv, "--developer", developer, "--limit", "2"], capture_output=True, text=True)
+    assert found.returncode == 0
+    assert len(found.stdout.splitlines()) == 3 and developer in found.stdout.splitlines()[1]
+    missing = subprocess.run([sys.executable, script, cleaned_csv, "--developer", "No Such Developer"], capture_output=True, text=True)
+    assert missing.returncode == 1
+
+# # # # # # # # # # # #
+#   SERVER            #
+# # # # # # # # # # # #
+
+# the metrics of the report written by the access script, by name
+def report_metrics(file_name, output_directory):
+    vga.run_video_games_access(file_name, output_directory=str(output_directory), text_only=True, use_cache=False)
+    with open(output_directory / "ndjson" / "games.ndjson") as metrics_file:
+        return {metric['metric']: metric['value'] for metric in map(json.loads, metrics_file)}
+
+# the state of a server on file_name, the dataset loaded and the charts drawn by executor
+def new_server(file_name, executor):
+    return {'file name': file_name, 'signature': None, 'frequency tables': None, 'cache': {}, 'lock': asyncio.Lock(), 'executor': executor, 'fast charts': True}
+
+# send requests to a server answering on a free port of localhost, returning the status and body of each
+async def server_responses(file_name, requests):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        server = new_server(file_name, executor)
+        http_server = await asyncio.start_server(lambda reader, writer: vgs.handle_request(server, reader, writer), '127.0.0.1', 0)
+        port = http_server.sockets[0].getsockname()[1]
+        responses = []
+        async with http_server:
+            for method, path in requests:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+                response = await reader.read()
+                writer.close()
+                head, body = response.split(b"\r\n\r\n", 1)
+                responses.append((int(head.split()[1]), body))
+        return responses
+
+# the json endpoints answer the same numbers as the report, the charts are png images
+def test_server_endpoints_match_the_report(tmp_path):
+    file_name = write_games_csv(tmp_path / "source", seed=31)
+    metrics = report_metrics(file_name, tmp_path / "report")
+    chart = next(iter(vgs.CHARTS))
+    requests = [('GET', '/total'), ('GET', '/counts/genre'), ('GET', '/most-common/platform'), ('GET', '/least-common/developer'),
+                ('GET', f'/charts/{chart}.png'), ('GET', '/counts/nothing'), ('POST', '/total')]
+    total, genres, platform, developer, png, missing, post = asyncio.run(server_responses(file_name, requests))
+
+    assert total == (200, json.dumps({'games': metrics['total games']}).encode())
+    assert json.loads(genres[1]) == metrics['games by genre']
+    assert json.loads(platform[1]) == metrics['most common platform']
+    assert json.loads(developer[1]) == metrics['least common developer']
+    assert png[0] == 200 and png[1].startswith(b"\x89PNG")
+    assert missing[0] == 404 and post[0] == 405
+
+# a csv file written again is loaded again, and the cached answers dropped, on the next request
+def test_server_reloads_a_changed_csv_file(tmp_path):
+    file_name = write_games_csv(tmp_path / "source", rows=200, seed=32)
+    totals_before = report_metrics(file_name, tmp_path / "before")['total games']
+
+    async def totals_around_a_rewrite():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            server = new_server(file_name, executor)
+            totals = []
+            for rows in [None, 400]:
+                if rows:
+                    vgbm.generate_video_games_csv(file_name, rows, 33)
+                await vgs.refresh_dataset(server)
+                totals.append(json.loads((await vgs.cached_response(server, '/total'))[2])['games'])
+            return totals
+
+    totals = asyncio.run(totals_around_a_rewrite())
+    assert totals == [totals_before, report_metrics(file_name, tmp_path / "after")['total games']]
+    assert totals[0] != totals[1]
+
+# # # # # # # # # # # #
+#   PIPELINE          #
+# # # # # # # # # # # #
+
+# three stages in a row, the first two kept on disk
+def chained_stages():
+    return {
+        'first': {'function': len, 'inputs': ['csv file'], 'memoize': True},
+        'second': {'function': lambda first: first + 1, 'inputs': ['first'], 'memoize': True},
+        'third': {'function': lambda second: second * 2, 'inputs': ['second']},
+    }
+
+# a memo removed once the stages a run needs are found leaves a stage waiting for a value no stage gives,
+# the run stops with an error naming it instead of waiting forever
+def test_pipeline_stops_when_a_stage_is_stuck(tmp_path, monkeypatch):
+    file_name = write_games_csv(tmp_path / "source")
+    memo_directory = str(tmp_path / "memo")
+    assert vgp.run_pipeline(chained_stages(), ['third'], file_name, memo_directory=memo_directory) == {'third': 2 * (len(file_name) + 1)}
+
+    required_stages = vgp.required_stages
+    def remove_memos_after(stages, targets, keys, memo_directory):
+        required = required_stages(stages, targets, keys, memo_directory)
+        os.remove(vgp.memo_file(memo_directory, 'second', keys['second']))
+        return required
+    monkeypatch.setattr(vgp, 'required_stages', remove_memos_after)
+    with pytest.raises(ValueError, match="'second' waits for 'first'"):
+        vgp.run_pipeline(chained_stages(), ['third'], file_name, memo_directory=memo_directory)
+
+# # # # # # # # # # # #
+#   CROSS ANALYSIS    #
+# # # # # # # # # # # #
+
+# a cube of a few cleaned games
+def small_cube():
+    df = vg.pd.DataFrame({
+        'Release Year': [2020, 2020, 2021, 2021],
+        'Release Month': [1, 1, 5, 6],
+        'Genre': ['RPG', 'RPG', 'Action', 'RPG'],
+        'Platform': ['PC', 'PC', 'Switch', 'PC'],
+        'Age Rating': ['Teen', 'Teen', 'Everyone', 'Mature'],
+        'Publisher': ['Pub 1', 'Pub 1', 'Pub 2', 'Pub 1'],
+    })
+    return vg.build_cube(df)
+
+# the slice by no dimension is the grand total, with and without filters
+def test_cube_slice_without_dimensions_is_the_total():
+    cube = small_cube()
+    assert vg.cube_slice(cube, []) == 4
+    assert vg.cube_slice(cube, [], {'Platform': 'PC'}) == 3
+    assert vg.cube_slice(cube, ['Genre']).sum() == vg.cube_slice(cube, [])
+
+# with the platform facts the cube counts a game under every platform, like the platform counts
+def test_cube_counts_every_platform():
+    df = vg.pd.DataFrame({
+        'Release Date': ['1/5/2020', '3/2/2021', '6/9/2021'],
+        'Genre': ['RPG', 'Action', 'RPG'],
+        'Age Rating': ['Teen', 'Everyone', 'Mature'],
+        'Publisher': ['Pub 1', 'Pub 2', 'Pub 1'],
+        'Platforms Info': [
+            "[{'Platform': 'PC', 'Platform Metascore': '80', 'Platform Metascore Count': 'Based on 3 Critic Reviews'}, {'Platform': 'Switch', 'Platform Metascore': '75', 'Platform Metascore Count': 'Based on 5 Critic Reviews'}]",
+            "[{'Platform': 'Switch', 'Platform Metascore': '70', 'Platform Metascore Count': 'Based on 4 Critic Reviews'}]",
+            "[{'Platform': 'PC', 'Platform Metascore': 'tbd', 'Platform Metascore Count': 'Based on 1 Critic Reviews'}]",
+        ],
+    })
+    platform_facts = vg.build_platform_facts(df)
+    df['Platform'] = ['PC', 'Switch', 'PC']
+    vg.normalize_release_date(df)
+    cube = vg.build_cube(df, platform_facts)
+    platforms = vg.cube_slice(cube, ['Platform'])
+    assert dict(zip(platforms.index.get_level_values('Platform'), platforms)) == vg.platform_frequency_table(platform_facts).to_dict()
+    assert vg.cube_slice(cube, []) == 4
@@ -3,47 +3,240 @@
 # # # # # # # # # # # #
 
 import pandas as pd
+import numpy as np
 import sys
-from io import StringIO
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
 import logging
-import ast
 import re
+import hashlib
+import json
+import tempfile
+import shutil
+import glob
+import importlib.util
+import time
+import cProfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# the plotting stack is imported by load_plotting when the first chart is drawn, so runs that
+# don't draw charts never load matplotlib and seaborn
+plt = None
+sns = None
+Figure = None
+FigureCanvasAgg = None
 
 # # # # # # # # # # # #
 #   OUTPUT FILES      #
 # # # # # # # # # # # #
 
-# get the file path
-def get_file_path(file_name, extension):
-    script_directory = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(script_directory, f"{os.path.splitext(file_name)[0]}.{extension}")
+# column types used when reading in chunks, so every chunk hashes and counts its values the same way
+CSV_DTYPES = {
+    'Title': str,
+    'Release Date': str,
+    'Developer': str,
+    'Publisher': str,
+    'Genres': str,
+    'Product Rating': str,
+    'User Score': 'float64',
+    'User Ratings Count': 'float64',
+    'Platforms Info': str,
+}
+
+# get the file path, in the script directory unless another directory is given
+def get_file_path(file_name, extension, directory=None):
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    file_path = os.path.join(directory, f"{os.path.splitext(file_name)[0]}.{extension}")
     return file_path
 
-# setup logging to save logs to a file
+# setup logging to save logs to a file, replacing the log file of an earlier run in the same process
 def setup_logging(log_file):
-    logging.basicConfig(level=logging.INFO, filemode='w', filename=log_file)
+    logging.basicConfig(level=logging.INFO, filemode='w', filename=log_file, force=True)
     logging.getLogger().setLevel(logging.INFO)
 
-# read the csv file, extract the name and create a txt output file
+# read the csv file
 def start_process_csv_file(file_name):
     logging.info(f"'start process csv file' {file_name} started.")
     df = pd.read_csv(file_name)
-    output_file = f"{os.path.splitext(file_name)[0]}.txt"
-    output_buffer = StringIO()
-    sys.stdout = output_buffer
     logging.info("'start process csv file' completed.")
-    return df, output_file, output_buffer
+    return df
+
+# read the csv file in chunks of chunksize rows
+def start_stream_csv_file(file_name, chunksize):
+    logging.info(f"'start stream csv file' {file_name} started.")
+    chunks = pd.read_csv(file_name, chunksize=chunksize, dtype=CSV_DTYPES)
+    logging.info("'start stream csv file' completed.")
+    return chunks
+
+# the text and metrics of the report written while cleaning the cached dataframe
+def cached_cleaning_report(cache_file):
+    with open(f"{os.path.splitext(cache_file)[0]}.txt") as cleaning_report, open(f"{os.path.splitext(cache_file)[0]}.ndjson") as cleaning_metrics:
+        return cleaning_report.read(), cleaning_metrics.read()
+
+# read the cleaned dataframe from the cache and write its cleaning report again
+def start_cached_csv_file(file_name, cache_file, report=None):
+    logging.info(f"'start cached csv file' {file_name} from {cache_file} started.")
+    df = pd.read_feather(cache_file)
+    write_report(report, *cached_cleaning_report(cache_file))
+    logging.info("'start cached csv file' completed.")
+    return df
 
-# save the analysis results to the txt file
-def end_process_csv_file(output_file, output_buffer):
-    logging.info("'end process csv file' started.")
-    sys.stdout = sys.__stdout__
-    with open(output_file, "w") as output_file:
-        output_file.write(output_buffer.getvalue())
-    logging.info("'end process csv file' completed.")
+# # # # # # # # # # # #
+#   REPORT            #
+# # # # # # # # # # # #
+
+# The report is written while the pipeline runs, to a txt file for people and to an ndjson file with
+# one json object per metric for other jobs. Both files are buffered and flushed at the end of every
+# section, so a run that stops keeps the sections it finished and the report is never held in
+# memory. Without a report the text goes to stdout and the metrics are dropped.
+
+# the write buffer of the report files
+REPORT_BUFFER_SIZE = 64 * 1024
+
+# open the txt and ndjson files of a report
+def open_report(txt_file, ndjson_file):
+    logging.info(f"'open report' {txt_file} started.")
+    report = {
+        'txt': open(txt_file, "w+", buffering=REPORT_BUFFER_SIZE),
+        'ndjson': open(ndjson_file, "w+", buffering=REPORT_BUFFER_SIZE),
+    }
+    logging.info("'open report' completed.")
+    return report
+
+# print to the txt file of the report, or to stdout without a report
+def report_print(report, *values):
+    print(*values, file=report['txt'] if report else sys.stdout)
+
+# the json value of numpy numbers, periods and the other values json doesn't know
+def metric_value(value):
+    return value.item() if hasattr(value, 'item') else str(value)
+
+# write a metric to the ndjson file of the report
+def report_metric(report, metric, value):
+    if report:
+        report['ndjson'].write(json.dumps({'metric': metric, 'value': value}, default=metric_value) + "\n")
+
+# the metric of a frequency table, most common first
+def counts_metric(value_counts):
+    return [{'value': value, 'games': games} for value, games in value_counts.items()]
+
+# end a section of the report and write it to disk
+def end_report_section(report):
+    report_print(report, "-" * 50)
+    report_print(report, "-" * 50)
+    if report:
+        report['txt'].flush()
+        report['ndjson'].flush()
+
+# where the report has got to, to read what was written since with read_report
+def report_position(report):
+    return report['txt'].tell(), report['ndjson'].tell()
+
+# the text and metrics written to the report since position
+def read_report(report, position):
+    written = []
+    for report_file, start in zip([report['txt'], report['ndjson']], position):
+        end = report_file.tell()
+        report_file.seek(start)
+        written.append(report_file.read())
+        report_file.seek(end)
+    return tuple(written)
+
+# write text and metrics that were written to another report
+def write_report(report, text, metrics):
+    if report:
+        report['txt'].write(text)
+        report['ndjson'].write(metrics)
+    else:
+        sys.stdout.write(text)
+
+# write the rest of the report to disk and close it
+def close_report(report):
+    logging.info("'close report' started.")
+    report['txt'].close()
+    report['ndjson'].close()
+    logging.info("'close report' completed.")
+
+# # # # # # # # # # # #
+#   STAGES            #
+# # # # # # # # # # # #
+
+# start recording the pipeline stages, with a cProfile dump per stage in profile_directory when given
+def start_stage_metrics(profile_directory=None):
+    if profile_directory:
+        os.makedirs(profile_directory, exist_ok=True)
+    return {'profile directory': profile_directory, 'stages': [], 'background': {}}
+
+# the peak resident memory of the process in bytes, None where the resource module doesn't exist
+def peak_memory():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# the rows of a dataframe, or of the dataframe returned with the txt output file
+def count_rows(value):
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    return None
+
+# run one pipeline stage and record its wall time, cpu time, rows in and out and how much it
+# raised the peak memory of the process
+def run_stage(stage_metrics, function, *args, **kwargs):
+    stage = function.__name__.replace('_', ' ')
+    rows_in = count_rows(args[0]) if args else None
+    memory_before = peak_memory()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    if stage_metrics['profile directory']:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(function, *args, **kwargs)
+        profile_number = len(stage_metrics['stages']) + 1
+        profiler.dump_stats(os.path.join(stage_metrics['profile directory'], f"{profile_number:02d}_{function.__name__}.prof"))
+    else:
+        result = function(*args, **kwargs)
+
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    memory_after = peak_memory()
+    rows_out = count_rows(result)
+    if rows_out is None and args:
+        rows_out = count_rows(args[0])
+
+    stage_metrics['stages'].append({
+        'stage': stage,
+        'wall time': round(wall_time, 6),
+        'cpu time': round(cpu_time, 6),
+        'rows in': rows_in,
+        'rows out': rows_out,
+        'peak memory delta': None if memory_before is None else memory_after - memory_before,
+    })
+    return result
+
+# save the recorded stages to a json file
+def save_stage_metrics(stage_metrics, stages_file):
+    logging.info(f"'save stage metrics' {stages_file} started.")
+    stages = stage_metrics['stages']
+    summary = {
+        'wall time': round(sum(stage['wall time'] for stage in stages), 6),
+        'cpu time': round(sum(stage['cpu time'] for stage in stages), 6),
+        'peak memory': peak_memory(),
+        'stages': stages,
+    }
+    # the work done in background processes overlaps the stages, so it's kept out of their totals
+    if stage_metrics['background']:
+        summary['background'] = stage_metrics['background']
+    with open(stages_file, "w") as stages_json:
+        json.dump(summary, stages_json, indent=4)
+    logging.info("'save stage metrics' completed.")
 
 # # # # # # # # # # # #
 #   CHECKS            #
@@ -75,37 +268,55 @@ def columns_validation(df):
 # # # # # # # # # # # #
 
 # print the info of the excel file
-def print_info(df):
+def print_info(df, report=None):
     logging.info("'print info' started.")
-    df.info()
+    df.info(buf=report['txt'] if report else None)
+    report_metric(report, "info", {
+        'rows': len(df),
+        'columns': {column: {'dtype': str(dtype), 'non null': non_null} for column, dtype, non_null in zip(df.columns, df.dtypes, df.count())},
+    })
     logging.info("'print info' completed.")
 
 # print a description of the excel file
-def print_description(df):
+def print_description(df, report=None):
     logging.info("'print description' started.")
-    print(df.describe())
+    report_print(report, df.describe())
     logging.info("'print description' completed.")
 
 # print the first 5 rows of the excel file
-def print_first_row(df):
+def print_first_row(df, report=None):
     logging.info("'print first row' started.")
-    print(df.head())
+    report_print(report, df.head())
     logging.info("'print first row' completed.")
 
 # # # # # # # # # # # #
 #   CLEANING          #
 # # # # # # # # # # # #
 
+# the columns dropped and renamed by the cleaning
+REMOVED_COLUMNS = ['User Score', 'User Ratings Count', 'Platforms Info']
+RENAMED_COLUMNS = {'Product Rating' : 'Age Rating', 'Genres' : 'Genre'}
+
+# the "Product Rating" values and their cleaned "Age Rating"
+AGE_RATING_MAPPING = {
+    'Rated T For Teen': 'Teen',
+    'Rated E For Everyone': 'Everyone',
+    'Rated M For Mature': 'Mature',
+    'Rated E +10 For Everyone +10': 'Everyone +10',
+    'Rated RP For Rate Pending': 'Rate Pending',
+    'Rated AO For Adults Only': 'Adults Only'
+}
+
 # removes columns from the dataframe
 def remove_columns(df):
     logging.info("'remove columns' started.")
-    df.drop(columns=['User Score', 'User Ratings Count', 'Platforms Info'], inplace=True)
+    df.drop(columns=REMOVED_COLUMNS, inplace=True)
     logging.info("'remove columns' completed.")
 
 # rename column
 def rename_column(df):
     logging.info("'rename column' started.")
-    df.rename(columns={'Product Rating' : 'Age Rating', 'Genres' : 'Genre'}, inplace=True)
+    df.rename(columns=RENAMED_COLUMNS, inplace=True)
     logging.info("'rename column' completed.")
 
 # removes rows from the dataframe
@@ -127,164 +338,1408 @@ def reset_index(df):
     logging.info("'reset index' completed.")
 
 # check missing values
-def check_missing_values(df):
+def check_missing_values(df, report=None):
     logging.info("'check missing values' started.")
+    missing_values = drop_missing_values(df)
+    print_missing_values(missing_values, report)
+    logging.info("'check missing values' completed.")
+    return missing_values
+
+# count the missing values and drop the rows that have any
+def drop_missing_values(df):
     missing_values = df.isnull().sum()
-    print('Missing values:\n', missing_values)
-    print("-" * 50)
-    print("-" * 50)
 
     if missing_values.any():
         df.dropna(inplace=True)
     
     # df.fillna(value=fill_value, inplace=True)
-    
-    logging.info("'check missing values' completed.")
+
     return missing_values
 
+# print the missing values
+def print_missing_values(missing_values, report=None):
+    report_print(report, 'Missing values:\n', missing_values)
+    report_metric(report, "missing values", missing_values.to_dict())
+    end_report_section(report)
+
 # clean up the "Age Rating" column
 def clean_age_rating(df):
     logging.info("'clean age rating' started.")
-    rating_mapping = {
-        'Rated T For Teen': 'Teen',
-        'Rated E For Everyone': 'Everyone',
-        'Rated M For Mature': 'Mature',
-        'Rated E +10 For Everyone +10': 'Everyone +10',
-        'Rated RP For Rate Pending': 'Rate Pending',
-        'Rated AO For Adults Only': 'Adults Only'
-    }
-    df['Age Rating'] = df['Age Rating'].map(rating_mapping)
+    df['Age Rating'] = df['Age Rating'].map(AGE_RATING_MAPPING)
     logging.info("'clean age rating' completed.")
 
 # extracting information from the "Platform" column
 def extract_platform_info(df):
     logging.info("'extract platform info' started.")
-    df['Platform'] = df['Platforms Info'].apply(lambda x: ast.literal_eval(x)[0]['Platform'] if pd.notnull(x) and ast.literal_eval(x) else None)
+    df['Platform'] = first_platform(df['Platforms Info'])
     logging.info("'extract platform info' completed.")
 
+# the cleaned columns with few distinct values, stored as categoricals
+CATEGORICAL_COLUMNS = ['Developer', 'Publisher', 'Genre', 'Age Rating', 'Platform']
+
+# converts the low cardinality columns to categoricals, the release date parts are already small integers
+# from normalize_release_date
+def compact_dataframe(df):
+    logging.info("'compact dataframe' started.")
+    memory_before = df.memory_usage(deep=True).sum()
+
+    for column in CATEGORICAL_COLUMNS:
+        # categories in the order they are first seen keep the frequency tables the same as before
+        df[column] = pd.Categorical(df[column], categories=pd.unique(df[column]))
+
+    memory_after = df.memory_usage(deep=True).sum()
+    logging.info(f"'compact dataframe' completed, memory usage went from {memory_before / 1024 ** 2:.2f} MB to {memory_after / 1024 ** 2:.2f} MB.")
+
+# clean raw rows in place, the part of the cleaning that needs no other rows: check the columns,
+# rename them, clean the age rating, extract the platform and drop the rows with missing values,
+# returns the missing values
+def clean_rows(df):
+    columns_validation(df)
+    rename_column(df)
+    clean_age_rating(df)
+    extract_platform_info(df)
+    return drop_missing_values(df)
+
+# clean the raw games, the rows by clean_workers processes when given, then remove the duplicates and
+# the unused columns and compact the rest, writing the missing values and duplicates sections to the
+# report. With explode_platforms the platform facts are built before "Platforms Info" is removed, and
+# with stage_metrics every step is recorded as a stage. Returns the cleaned games and the platform
+# facts, None when they aren't built
+def clean_games(df, near_duplicates=False, report=None, clean_workers=None, explode_platforms=False, stage_metrics=None):
+    logging.info("'clean games' started.")
+    def step(function, *args):
+        return run_stage(stage_metrics, function, *args) if stage_metrics else function(*args)
+
+    if clean_workers:
+        # the rows are cleaned a partition per worker and put back in order, the same as cleaning them here
+        df, missing_values = step(clean_in_parallel, df, clean_workers)
+    else:
+        missing_values = step(clean_rows, df)
+    step(print_missing_values, missing_values, report)
+    step(remove_duplicate_games, df, near_duplicates, report)
+    # every platform of a game, before its "Platforms Info" cell is removed
+    platform_facts = step(build_platform_facts, df) if explode_platforms else None
+    step(remove_columns, df)
+    step(reset_index, df)
+    step(compact_dataframe, df)
+    logging.info("'clean games' completed.")
+    return df, platform_facts
+
+# # # # # # # # # # # #
+#   DUPLICATES        #
+# # # # # # # # # # # #
+
+# Merged feeds list the same game more than once, not always in the same way. remove_duplicate_games
+# removes them by two rules, in this order:
+# - exact row: the same 64-bit hash of every cell as an earlier row.
+# - same normalized title: the same Developer, Release Year and Title once the title is case folded,
+#   stripped of punctuation and of edition tags like "Deluxe Edition" or "Remastered" wherever they
+#   are in it, so two titles are the same game only when the words they differ by are edition tags.
+#   "Picross e2" and "Picross e3", "Snipperclips" and "Snipperclips Plus" or "FIFA 21" and "FIFA 22"
+#   stay apart.
+# The second rule is a hash of the normalized keys, it never compares pairs of titles. The first row of
+# every duplicate group is kept.
+
+# the edition tags dropped from a title before comparing it, after it is case folded and stripped of punctuation
+EDITION_TAGS = [
+    'game of the year edition', 'game of the year', 'goty edition', 'goty', 'complete edition', 'definitive edition',
+    'deluxe edition', 'special edition', 'collectors edition', 'limited edition', 'gold edition', 'ultimate edition',
+    'enhanced edition', 'anniversary edition', 'standard edition', 'edition', 'hd remaster', 'remastered', 'remaster', 'hd',
+]
+EDITION_TAGS_PATTERN = r'\b(?:' + '|'.join(re.escape(tag) for tag in sorted(EDITION_TAGS, key=len, reverse=True)) + r')\b'
+
+# lower case words without punctuation
+def normalize_text(values):
+    values = values.astype(str).str.casefold()
+    values = values.str.replace(r"['’]", '', regex=True).str.replace(r'[\W_]+', ' ', regex=True)
+    return values.str.strip()
+
+# the title without its case, punctuation and edition tags
+def normalize_title(titles):
+    normalized = normalize_text(titles).str.replace(EDITION_TAGS_PATTERN, ' ', regex=True).str.split().str.join(' ')
+    # a title that is only an edition tag keeps it
+    return normalized.where(normalized != '', normalize_text(titles))
+
+# the rows with the same 64-bit hash as an earlier row
+def exact_duplicate_rows(df):
+    return pd.util.hash_pandas_object(df, index=False).duplicated().to_numpy()
+
+# the release year of every row, from the "Release Year" column once the release dates are normalized and from
+# the end of the "Release Date" text before, without parsing the dates again
+def release_years(df):
+    if 'Release Year' in df.columns:
+        return df['Release Year'].to_numpy()
+    return df['Release Date'].str.rpartition('/')[2].to_numpy()
+
+# the keys of the same normalized title rule, the normalized developer, the release year and the normalized title
+def near_duplicate_keys(df):
+    return pd.DataFrame({
+        'Developer': normalize_text(df['Developer']).to_numpy(),
+        'Release Year': release_years(df),
+        'Title': normalize_title(df['Title']).to_numpy(),
+    })
+
+# removes the duplicate rows and reports how many each rule removed
+def remove_duplicate_games(df, near_duplicates=False, report=None):
+    logging.info("'remove duplicate games' started.")
+    removed_rows = drop_duplicate_games(df, near_duplicates)
+    print_removed_duplicates(removed_rows, report)
+    logging.info(f"'remove duplicate games' completed, {sum(removed_rows.values())} rows removed.")
+    return removed_rows
+
+# drops the duplicate rows by every rule, or only the exact ones, and returns how many each rule dropped
+def drop_duplicate_games(df, near_duplicates=False):
+    removed_rows = {}
+
+    duplicated = exact_duplicate_rows(df)
+    removed_rows['exact row'] = int(duplicated.sum())
+    df.drop(df.index[duplicated], inplace=True)
+
+    if near_duplicates:
+        keys = near_duplicate_keys(df)
+        # the rows without a release year or developer are only checked by the exact rule
+        blocked = keys['Release Year'].notnull().to_numpy() & (keys['Developer'] != '').to_numpy()
+        duplicated = keys.duplicated().to_numpy() & blocked
+        removed_rows['same normalized title'] = int(duplicated.sum())
+        df.drop(df.index[duplicated], inplace=True)
+
+    return removed_rows
+
+# print the rows removed by every duplicate rule
+def print_removed_duplicates(removed_rows, report=None):
+    report_print(report, 'Duplicate rows removed:\n', pd.Series(removed_rows, dtype='int64'))
+    report_metric(report, "duplicate rows removed", removed_rows)
+    end_report_section(report)
+
+# # # # # # # # # # # #
+#   PLATFORMS INFO    #
+# # # # # # # # # # # #
+
+# a quoted value without escape sequences, as written by python's repr
+QUOTED_VALUE = r"'([^'\\]*)'" + r'|"([^"\\]*)"'
+
+# a single {'Platform': ..., 'Platform Metascore': ..., 'Platform Metascore Count': ...} entry
+PLATFORM_ENTRY = (
+    r"\{'Platform': (?:" + QUOTED_VALUE + r"), "
+    r"'Platform Metascore': (?:" + QUOTED_VALUE + r"), "
+    r"'Platform Metascore Count': (?:" + QUOTED_VALUE + r")\}"
+)
+
+PLATFORM_ENTRY_PATTERN = re.compile(PLATFORM_ENTRY)
+FIRST_PLATFORM_PATTERN = re.compile(r"^\[\{'Platform': (?:" + QUOTED_VALUE + r")")
+
+# a whole "Platforms Info" cell, only cells matching this are parsed without the strict parser
+PLATFORMS_INFO_PATTERN = re.compile(r"\[(?:" + PLATFORM_ENTRY + r"(?:, " + PLATFORM_ENTRY + r")*)?\]")
+
+# finds the cells that the regex parser can't handle and must go through ast.literal_eval
+def malformed_platforms_info(platforms_info):
+    well_formed = platforms_info.str.fullmatch(PLATFORMS_INFO_PATTERN, na=False)
+    return platforms_info[~well_formed & platforms_info.notnull()]
+
+# get the first platform of every "Platforms Info" cell
+def first_platform(platforms_info):
+    logging.info("'first platform' started.")
+    first = platforms_info.str.extract(FIRST_PLATFORM_PATTERN)
+    first = first[0].fillna(first[1]).astype(object)
+    first[first.isnull()] = None
+
+    malformed = malformed_platforms_info(platforms_info)
+    if len(malformed):
+        import ast
+    for index, value in malformed.items():
+        entries = ast.literal_eval(value)
+        first.loc[index] = entries[0]['Platform'] if entries else None
+
+    logging.info(f"'first platform' completed, {len(malformed)} cell(s) needed the strict parser.")
+    return first
+
+# parse every "Platforms Info" cell into one row per platform with its metascore and critic count
+def parse_platforms_info(platforms_info):
+    logging.info("'parse platforms info' started.")
+    malformed = malformed_platforms_info(platforms_info)
+    matches = platforms_info.drop(malformed.index).dropna().str.extractall(PLATFORM_ENTRY_PATTERN)
+    platforms = pd.DataFrame({
+        'Platform': matches[0].fillna(matches[1]),
+        'Platform Metascore': matches[2].fillna(matches[3]),
+        'Platform Metascore Count': matches[4].fillna(matches[5]),
+    }, index=matches.index)
+
+    if len(malformed):
+        import ast
+        records = []
+        index = []
+        for row, value in malformed.items():
+            for position, entry in enumerate(ast.literal_eval(value)):
+                records.append({
+                    'Platform': entry.get('Platform'),
+                    'Platform Metascore': entry.get('Platform Metascore'),
+                    'Platform Metascore Count': entry.get('Platform Metascore Count'),
+                })
+                index.append((row, position))
+        strict = pd.DataFrame(records, columns=platforms.columns, index=pd.MultiIndex.from_tuples(index, names=platforms.index.names))
+        platforms = pd.concat([platforms, strict]).sort_index()
+
+    platforms['Platform Metascore'] = pd.to_numeric(platforms['Platform Metascore'], errors='coerce')
+    platforms['Platform Metascore Count'] = pd.to_numeric(platforms['Platform Metascore Count'].astype(str).str.extract(r'(\d+)')[0], errors='coerce')
+    logging.info(f"'parse platforms info' completed, {len(malformed)} cell(s) needed the strict parser.")
+    return platforms
+
+# The platform facts hold one row per game and platform it was released on, the game as its position
+# in the cleaned dataframe and the platform as an integer code into the platform labels, with the
+# platform metascore and critic count. A game on several platforms is counted under each of them
+# while its wide row is kept once.
+
+# the platform facts of the cleaned games, from their "Platforms Info" cells, platforms listed twice
+# for a game are kept once
+def build_platform_facts(df):
+    logging.info("'build platform facts' started.")
+    platforms = parse_platforms_info(df['Platforms Info'])
+    platforms = platforms[platforms['Platform'].notnull()]
+    games = df.index.get_indexer(platforms.index.get_level_values(0))
+    codes, labels = pd.factorize(platforms['Platform'])
+    unique_facts = ~pd.Index(games.astype('int64') * len(labels) + codes).duplicated()
+
+    platform_facts = {
+        'labels': pd.Index(labels, name='Platform'),
+        'game': games[unique_facts].astype(np.min_scalar_type(max(len(df) - 1, 0))),
+        'platform': codes[unique_facts].astype(np.min_scalar_type(max(len(labels) - 1, 0))),
+        'metascore': platforms['Platform Metascore'].to_numpy(dtype='float32')[unique_facts],
+        'critic count': platforms['Platform Metascore Count'].to_numpy(dtype='float32')[unique_facts],
+    }
+    logging.info(f"'build platform facts' completed, {len(platform_facts['game'])} facts for {len(df)} games.")
+    return platform_facts
+
+# the games by platform, counting every platform a game was released on, most first and tied
+# platforms in the order they are first listed
+def platform_frequency_table(platform_facts):
+    counts = np.bincount(platform_facts['platform'], minlength=len(platform_facts['labels']))
+    frequency_table = pd.Series(counts, index=platform_facts['labels'], name='count', dtype='int64')
+    return frequency_table.sort_values(ascending=False, kind='stable')
+
+# the file of the platform facts saved next to a cache file
+def get_platform_facts_file(cache_file):
+    return f"{os.path.splitext(cache_file)[0]}_platforms.npz"
+
+# save the platform facts as numpy arrays
+def save_platform_facts(platform_facts, platform_facts_file):
+    arrays = {column.replace(' ', '_'): values for column, values in platform_facts.items() if column != 'labels'}
+    with open(f"{platform_facts_file}.{os.getpid()}.tmp", "wb") as facts_file:
+        np.savez(facts_file, labels=platform_facts['labels'].to_numpy(dtype=str), **arrays)
+    os.replace(f"{platform_facts_file}.{os.getpid()}.tmp", platform_facts_file)
+
+# read the platform facts saved by save_platform_facts
+def load_platform_facts(platform_facts_file):
+    with np.load(platform_facts_file, allow_pickle=False) as arrays:
+        platform_facts = {'labels': pd.Index(arrays['labels'].tolist(), dtype='str', name='Platform')}
+        for column in ['game', 'platform', 'metascore', 'critic count']:
+            platform_facts[column] = arrays[column.replace(' ', '_')]
+    return platform_facts
+
+# # # # # # # # # # # #
+#   COUNTS            #
+# # # # # # # # # # # #
+
+# the columns analysed by the count, most common and least common functions
+FREQUENCY_COLUMNS = ['Release Period', 'Developer', 'Publisher', 'Genre', 'Age Rating', 'Platform']
+
+# Frequency tables hold the counts of every analysed column, computed once and shared by all
+# the count, most common, least common and chart functions. Each table is sorted by count, most
+# common first, and tied values keep the order they are first seen in the data, like value_counts().
+# From a table, the most common value breaks ties by the smallest value, like Series.mode, and the
+# least common value breaks ties by the value seen first, like min(unique, key=count).
+
+# counts every analysed column once
+def build_frequency_tables(df):
+    logging.info("'build frequency tables' started.")
+    frequency_tables = {column: frequency_table(df[column]) for column in FREQUENCY_COLUMNS}
+    logging.info("'build frequency tables' completed.")
+    return frequency_tables
+
+# counts the values of a column, categorical columns give the same table as string columns
+# because compact_dataframe orders their categories by first appearance
+def frequency_table(values):
+    value_counts = values.value_counts(sort=False)
+    if isinstance(value_counts.index, pd.CategoricalIndex):
+        value_counts.index = value_counts.index.astype(value_counts.index.categories.dtype)
+        value_counts = value_counts[value_counts > 0]
+    return value_counts.sort_values(ascending=False, kind='stable')
+
+# the counts of a column, from the frequency tables or counted from the dataframe
+def get_value_counts(df, column):
+    if isinstance(df, dict):
+        return df[column]
+    return frequency_table(df[column])
+
+# the most common value of a frequency table
+def most_common_value(value_counts):
+    return min(value_counts[value_counts == value_counts.max()].index)
+
+# the least common value of a frequency table
+def least_common_value(value_counts):
+    return value_counts[value_counts == value_counts.min()].index[0]
+
+# # # # # # # # # # # #
+#   STREAMING         #
+# # # # # # # # # # # #
+
+# the row hashes of no row yet, kept sorted so a chunk is looked up with one binary search per row
+def no_row_hashes():
+    return np.array([], dtype='uint64')
+
+# removes the rows already seen in this or an earlier chunk, using a 64-bit hash of each row, adds the
+# hashes of the rows kept to seen['row hashes'] and returns how many rows were removed
+def remove_hashed_duplicates(df, seen):
+    logging.info("'remove hashed duplicates' started.")
+    row_hashes = seen['row hashes']
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    positions = np.searchsorted(row_hashes, hashes).clip(max=max(len(row_hashes) - 1, 0))
+    seen_before = row_hashes[positions] == hashes if len(row_hashes) else np.zeros(len(hashes), dtype=bool)
+    duplicated = seen_before | pd.Index(hashes).duplicated()
+    df.drop(df.index[duplicated], inplace=True)
+    # both arrays are sorted, so the stable sort only merges them
+    seen['row hashes'] = np.sort(np.concatenate([row_hashes, np.sort(hashes[~duplicated])]), kind='stable')
+    logging.info("'remove hashed duplicates' completed.")
+    return int(duplicated.sum())
+
+# adds the counts of a cleaned chunk to the running counts, keeping the order values were first seen in
+def fold_value_counts(folded_counts, df):
+    for column, running_counts in folded_counts.items():
+        for value, count in df[column].value_counts(sort=False).items():
+            running_counts[value] = running_counts.get(value, 0) + count
+
+# the frequency tables of the running counts
+def folded_frequency_tables(folded_counts):
+    frequency_tables = {}
+    for column, counts in folded_counts.items():
+        frequency_table = pd.Series(counts, dtype='int64', name='count').rename_axis(column)
+        frequency_tables[column] = frequency_table.sort_values(ascending=False, kind='stable')
+    return frequency_tables
+
+# clean one chunk in place, dropping the rows whose hash is in seen['row hashes'], and return its
+# missing values and the duplicate rows removed
+def clean_chunk(chunk, seen):
+    missing_values = clean_rows(chunk)
+    duplicate_rows = remove_hashed_duplicates(chunk, seen)
+    remove_columns(chunk)
+    return missing_values, duplicate_rows
+
+# clean the chunks one at a time, append them to the cleaned csv and return the frequency tables, the
+# report has the info, missing values and duplicates sections of the in memory pipeline, only the
+# exact duplicates are removed
+def clean_csv_chunks(chunks, cleaned_csv, report=None):
+    logging.info("'clean csv chunks' started.")
+    folded_counts = {column: {} for column in FREQUENCY_COLUMNS}
+    info = None
+    missing_values = None
+    seen = {'row hashes': no_row_hashes()}
+    removed_rows = {'exact row': 0}
+    header = True
+
+    for chunk in chunks:
+        info = fold_info(info, chunk)
+        chunk_missing_values, duplicate_rows = clean_chunk(chunk, seen)
+        missing_values = chunk_missing_values if missing_values is None else missing_values + chunk_missing_values
+        removed_rows['exact row'] += duplicate_rows
+        chunk.to_csv(cleaned_csv, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        normalize_release_date(chunk)
+        fold_value_counts(folded_counts, chunk)
+
+    if info is not None:
+        print_folded_info(info, report)
+        print_missing_values(missing_values, report)
+        print_removed_duplicates(removed_rows, report)
+
+    frequency_tables = folded_frequency_tables(folded_counts)
+
+    logging.info(f"'clean csv chunks' completed, {len(seen['row hashes'])} distinct rows.")
+    return frequency_tables
+
+# # # # # # # # # # # #
+#   OUT OF CORE       #
+# # # # # # # # # # # #
+
+# The out of core backend cleans and counts a csv file larger than memory, with the same cleaned csv
+# and the same report as the in memory pipeline, except for the memory usage of the info section: it
+# adds up the memory of the chunks, which differs from the memory of the whole dataframe by a few bytes
+# per chunk since their string buffers aren't laid out the same. The csv file is read in chunks and
+# spilled to disk as arrow streams twice:
+# - by developer and release year, so every duplicate of a row, exact or near, lands in the same
+#   partition and the duplicates are removed one partition at a time.
+# - by position in the csv file, so the cleaned csv is written in the original order one range of
+#   rows at a time.
+# The position of every row is kept as its index, and the counts of every partition keep the first
+# position of each value, so the ties of the frequency tables are broken like in memory.
+
+# the rows read at a time, and the bytes of the csv file that go to one partition
+OUT_OF_CORE_CHUNKSIZE = 100_000
+OUT_OF_CORE_PARTITION_BYTES = 64 * 1024 ** 2
+
+# adds the rows, non null counts and memory usage of a raw chunk to the info of the csv file, the memory
+# usage is the sum over the chunks
+def fold_info(info, chunk):
+    if info is None:
+        return {'rows': len(chunk), 'dtypes': chunk.dtypes, 'non null': chunk.count(), 'memory usage': chunk.memory_usage(index=False)}
+    info['rows'] += len(chunk)
+    info['non null'] += chunk.count()
+    info['memory usage'] += chunk.memory_usage(index=False)
+    return info
+
+# print the info of the csv file the way df.info prints the whole dataframe
+def print_folded_info(info, report=None):
+    logging.info("'print folded info' started.")
+    # df.info leaves out the non null counts of dataframes with more rows than this
+    with_counts = info['rows'] <= pd.get_option('display.max_info_rows')
+    headers = [" # ", "Column", "Non-Null Count", "Dtype"] if with_counts else [" # ", "Column", "Dtype"]
+    rows = [
+        [f" {number}", str(column)] + ([f"{non_null} non-null"] if with_counts else []) + [str(dtype)]
+        for number, (column, non_null, dtype) in enumerate(zip(info['dtypes'].index, info['non null'], info['dtypes']))
+    ]
+    widths = [max(len(header), *(len(row[position]) for row in rows)) for position, header in enumerate(headers)]
+
+    dtype_counts = info['dtypes'].map(lambda dtype: dtype.name).value_counts()
+    memory_usage = int(info['memory usage'].sum()) + pd.RangeIndex(info['rows']).memory_usage()
+    size_qualifier = "+" if 'object' in dtype_counts else ""
+    for unit in ["bytes", "KB", "MB", "GB", "TB", "PB"]:
+        if memory_usage < 1024.0 or unit == "PB":
+            break
+        memory_usage /= 1024.0
+
+    lines = [
+        str(pd.DataFrame),
+        f"RangeIndex: {info['rows']} entries, 0 to {info['rows'] - 1}" if info['rows'] else "RangeIndex: 0 entries",
+        f"Data columns (total {len(rows)} columns):",
+        "  ".join(header.ljust(width) for header, width in zip(headers, widths)),
+        "  ".join(("-" * len(header)).ljust(width) for header, width in zip(headers, widths)),
+    ]
+    lines += ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows]
+    lines.append(f"dtypes: {', '.join(f'{name}({count:d})' for name, count in sorted(dtype_counts.items()))}")
+    lines.append(f"memory usage: {memory_usage:3.1f}{size_qualifier} {unit}")
+    report_print(report, "\n".join(lines))
+
+    report_metric(report, "info", {
+        'rows': info['rows'],
+        'columns': {column: {'dtype': str(dtype), 'non null': non_null} for column, dtype, non_null in zip(info['dtypes'].index, info['dtypes'], info['non null'])},
+    })
+    logging.info("'print folded info' completed.")
+
+# a set of arrow stream files in directory, one per partition, written a chunk at a time
+def open_spill(directory, name):
+    return {'directory': directory, 'name': name, 'schema': None, 'writers': {}}
+
+# the arrow stream file of a partition
+def spill_file(spill, partition):
+    return os.path.join(spill['directory'], f"{spill['name']}_{partition}.arrow")
+
+# append the rows of df, with their position, to the file of their partition
+def spill_rows(spill, df, partitions):
+    import pyarrow as pa
+    for partition, rows in df.groupby(partitions, sort=False):
+        rows = rows.reset_index(names='Row')
+        if spill['schema'] is None:
+            spill['schema'] = pa.Schema.from_pandas(rows, preserve_index=False)
+        if partition not in spill['writers']:
+            spill['writers'][partition] = pa.ipc.new_stream(spill_file(spill, partition), spill['schema'])
+        spill['writers'][partition].write_table(pa.Table.from_pandas(rows, schema=spill['schema'], preserve_index=False))
+
+# close the files of every partition
+def close_spill(spill):
+    for writer in spill['writers'].values():
+        writer.close()
+
+# read the partitions back one at a time, indexed by the position of their rows, deleting each file once read
+def read_spill(spill):
+    import pyarrow as pa
+    for partition in sorted(spill['writers']):
+        with pa.OSFile(spill_file(spill, partition)) as source:
+            df = pa.ipc.open_stream(source).read_all().to_pandas()
+        os.remove(spill_file(spill, partition))
+        yield df.set_index('Row').rename_axis(None)
+
+# the count and first position of every value of the analysed columns of a partition
+def partition_value_counts(df):
+    positions = pd.Series(df.index, index=df.index)
+    return {column: positions.groupby(df[column], sort=False).agg(['size', 'min']) for column in FREQUENCY_COLUMNS}
+
+# add up the counts of every partition, the values in the order they were first seen in the csv file
+def merge_partition_value_counts(partition_counts):
+    frequency_tables = {}
+    for column in FREQUENCY_COLUMNS:
+        counts = pd.concat([value_counts[column] for value_counts in partition_counts]).groupby(level=0, sort=False).agg({'size': 'sum', 'min': 'min'})
+        frequency_table = counts.sort_values('min')['size'].rename('count').rename_axis(column)
+        frequency_tables[column] = frequency_table.sort_values(ascending=False, kind='stable')
+    return frequency_tables
+
+# clean a csv file that doesn't fit in memory, spilling it to disk, write the cleaned csv and return
+# the frequency tables
+def clean_csv_out_of_core(file_name, cleaned_csv, near_duplicates=False, report=None, chunksize=None, spill_directory=None):
+    logging.info("'clean csv out of core' started.")
+    partitions = max(1, -(-os.path.getsize(file_name) // OUT_OF_CORE_PARTITION_BYTES))
+
+    with tempfile.TemporaryDirectory(prefix="video_games_spill_", dir=spill_directory) as directory:
+        # the rows are cleaned a chunk at a time and spilled by developer and release year
+        info = None
+        missing_values = None
+        blocks = open_spill(directory, "block")
+        for chunk in pd.read_csv(file_name, dtype=CSV_DTYPES, chunksize=chunksize or OUT_OF_CORE_CHUNKSIZE):
+            info = fold_info(info, chunk)
+            chunk_missing_values = clean_rows(chunk)
+            missing_values = chunk_missing_values if missing_values is None else missing_values + chunk_missing_values
+            block_keys = near_duplicate_keys(chunk)[['Developer', 'Release Year']]
+            spill_rows(blocks, chunk, pd.util.hash_pandas_object(block_keys, index=False).to_numpy() % partitions)
+        close_spill(blocks)
+        print_folded_info(info, report)
+        print_missing_values(missing_values, report)
+
+        # the duplicates are removed a partition at a time and the rows left spilled by position
+        removed_rows = {}
+        partition_counts = []
+        ranges = open_spill(directory, "range")
+        for df in read_spill(blocks):
+            for rule, rows in drop_duplicate_games(df, near_duplicates).items():
+                removed_rows[rule] = removed_rows.get(rule, 0) + rows
+            remove_columns(df)
+            spill_rows(ranges, df, df.index.to_numpy() * partitions // info['rows'])
+            normalize_release_date(df)
+            partition_counts.append(partition_value_counts(df))
+        close_spill(ranges)
+        print_removed_duplicates(removed_rows, report)
+
+        # the cleaned csv is written a range of rows at a time, in the order of the csv file
+        header = True
+        for df in read_spill(ranges):
+            df.sort_index().to_csv(cleaned_csv, mode='w' if header else 'a', header=header, index=False)
+            header = False
+
+    frequency_tables = merge_partition_value_counts(partition_counts)
+    logging.info(f"'clean csv out of core' completed, {partitions} partitions.")
+    return frequency_tables
+
+# # # # # # # # # # # #
+#   PARALLEL CLEANING #
+# # # # # # # # # # # #
+
+# The parallel cleaning splits the rows into one partition per worker and cleans them in a process
+# pool. The raw dataframe is written once as an arrow file, in shared memory when the system has
+# room for it and on disk otherwise, and every worker memory maps it and takes its rows without a copy. The cleaned partitions
+# come back the same way, as arrow files the main process maps, so no dataframe is ever pickled.
+# The partitions keep the row labels of the raw dataframe and are put back in order, so the
+# duplicates, removed afterwards on the whole dataframe, and the rest of the pipeline are the
+# same as when the rows are cleaned in one process.
+
+# where the arrow files go by default, a memory backed file system
+SHARED_MEMORY_DIRECTORY = "/dev/shm"
+
+# a temporary directory for the arrow files of df, in shared_memory_directory when it exists and has
+# room for the raw and the cleaned rows, in the temporary directory of the system otherwise
+def make_arrow_directory(df, shared_memory_directory=None):
+    shared_memory_directory = shared_memory_directory or SHARED_MEMORY_DIRECTORY
+    # the raw arrow file and the cleaned partitions take about twice the memory of the dataframe
+    needed_bytes = 2 * int(df.memory_usage(deep=True).sum())
+    if os.path.isdir(shared_memory_directory) and shutil.disk_usage(shared_memory_directory).free > needed_bytes:
+        return tempfile.mkdtemp(prefix="video_games_clean_", dir=shared_memory_directory)
+    logging.warning(f"{shared_memory_directory} is missing or has less than {needed_bytes / 1024 ** 2:.0f} MB free, the arrow files go to disk.")
+    return tempfile.mkdtemp(prefix="video_games_clean_")
+
+# write a dataframe, with its row labels, as an arrow file
+def write_arrow_file(df, arrow_file):
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    with pa.OSFile(arrow_file, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+# memory map an arrow file and read rows start to stop of it, all of them by default
+def read_arrow_file(arrow_file, start=0, stop=None):
+    import pyarrow as pa
+    with pa.memory_map(arrow_file) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.slice(start, None if stop is None else stop - start).to_pandas()
+
+# clean rows start to stop of the raw arrow file into cleaned_file, runs in a worker process and
+# returns the missing values of the rows
+def clean_partition(raw_file, start, stop, cleaned_file):
+    df = read_arrow_file(raw_file, start, stop)
+    missing_values = clean_rows(df)
+    write_arrow_file(df, cleaned_file)
+    return missing_values
+
+# clean the rows like clean_rows in a process pool of clean_workers processes, the arrow files in
+# shared_memory_directory, SHARED_MEMORY_DIRECTORY by default, returns the cleaned dataframe and its
+# missing values
+def clean_in_parallel(df, clean_workers, shared_memory_directory=None):
+    logging.info(f"'clean in parallel' started, {clean_workers} workers.")
+    boundaries = np.linspace(0, len(df), clean_workers + 1).astype('int64')
+
+    directory = make_arrow_directory(df, shared_memory_directory)
+    try:
+        raw_file = os.path.join(directory, "raw.arrow")
+        write_arrow_file(df, raw_file)
+        cleaned_files = [os.path.join(directory, f"cleaned_{partition}.arrow") for partition in range(clean_workers)]
+
+        with ProcessPoolExecutor(max_workers=clean_workers) as executor:
+            futures = [
+                executor.submit(clean_partition, raw_file, start, stop, cleaned_file)
+                for start, stop, cleaned_file in zip(boundaries[:-1], boundaries[1:], cleaned_files)
+            ]
+            missing_values = sum(future.result() for future in futures)
+
+        df = pd.concat([read_arrow_file(cleaned_file) for cleaned_file in cleaned_files])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    logging.info("'clean in parallel' completed.")
+    return df, missing_values
+
+# # # # # # # # # # # #
+#   SKETCHES          #
+# # # # # # # # # # # #
+
+# The approximate mode counts the developers, publishers, genres and platforms of a feed too large
+# to count exactly, in one pass over the chunks and in a fixed amount of memory per column:
+# - a count-min sketch estimates the games of any value, never below the true count and above it
+#   by at most COUNT_MIN_EPSILON of the games with probability 1 - COUNT_MIN_DELTA.
+# - a Misra-Gries heavy hitters summary keeps HEAVY_HITTERS candidates, every value with more than
+#   1 / (HEAVY_HITTERS + 1) of the games is among them, they are listed with their count-min estimate.
+# - a HyperLogLog sketch estimates the distinct values, with a standard error of 1.04 / sqrt(registers).
+# A sketch is a dict of numpy arrays and a series, and two sketches of different chunks, or of
+# different processes, merge into the sketch of both. The release dates and age ratings have few
+# values and are still counted exactly. The rows with missing values are dropped like in memory, but
+# finding the duplicate rows would take memory for every row, so they are counted.
+
+# the columns counted by the sketches
+SKETCH_COLUMNS = ['Developer', 'Publisher', 'Genre', 'Platform']
+
+# the size of the sketches
+COUNT_MIN_WIDTH = 2048
+COUNT_MIN_DEPTH = 5
+HEAVY_HITTERS = 100
+HYPERLOGLOG_PRECISION = 14
+
+# the error bounds that follow from the sizes
+COUNT_MIN_EPSILON = np.e / COUNT_MIN_WIDTH
+COUNT_MIN_DELTA = np.exp(-COUNT_MIN_DEPTH)
+HYPERLOGLOG_ERROR = 1.04 / np.sqrt(2 ** HYPERLOGLOG_PRECISION)
+
+# the keys of the independent hashes, 16 characters each as hash_array wants
+COUNT_MIN_HASH_KEYS = [f"countminrow{row:05d}" for row in range(COUNT_MIN_DEPTH)]
+HYPERLOGLOG_HASH_KEY = "hyperloglog00000"
+
+# an empty sketch
+def new_sketch():
+    return {
+        'games': 0,
+        'count min': np.zeros((COUNT_MIN_DEPTH, COUNT_MIN_WIDTH), dtype='int64'),
+        'heavy hitters': pd.Series(dtype='int64'),
+        'hyperloglog': np.zeros(2 ** HYPERLOGLOG_PRECISION, dtype='uint8'),
+    }
+
+# the count-min column of every value in every row of the sketch
+def count_min_columns(values):
+    values = np.asarray(values, dtype=object)
+    return [pd.util.hash_array(values, hash_key=hash_key) % COUNT_MIN_WIDTH for hash_key in COUNT_MIN_HASH_KEYS]
+
+# keep the HEAVY_HITTERS largest counters, less the largest counter dropped, as Misra-Gries does
+def reduce_heavy_hitters(counters):
+    if len(counters) <= HEAVY_HITTERS:
+        return counters
+    threshold = counters.nlargest(HEAVY_HITTERS + 1).iloc[-1]
+    return counters[counters > threshold] - threshold
+
+# the sketch of the values of one chunk
+def sketch_values(values):
+    value_counts = values.value_counts()
+    sketch = new_sketch()
+    sketch['games'] = int(value_counts.sum())
+
+    for row, columns in enumerate(count_min_columns(value_counts.index)):
+        np.add.at(sketch['count min'][row], columns, value_counts.to_numpy())
+
+    sketch['heavy hitters'] = reduce_heavy_hitters(value_counts.astype('int64'))
+
+    # the first bits of the hash pick the register, which keeps the most leading zeros of the other bits
+    hashes = pd.util.hash_array(np.asarray(value_counts.index, dtype=object), hash_key=HYPERLOGLOG_HASH_KEY)
+    registers = (hashes >> np.uint64(64 - HYPERLOGLOG_PRECISION)).astype('int64')
+    remaining_bits = hashes & np.uint64(2 ** (64 - HYPERLOGLOG_PRECISION) - 1)
+    # fewer than 53 bits, so frexp gives their exact bit length
+    bit_lengths = np.frexp(remaining_bits.astype('float64'))[1]
+    np.maximum.at(sketch['hyperloglog'], registers, (64 - HYPERLOGLOG_PRECISION - bit_lengths + 1).astype('uint8'))
+    return sketch
+
+# the sketch of the values of both sketches
+def merge_sketches(sketch, other_sketch):
+    heavy_hitters = pd.concat([sketch['heavy hitters'], other_sketch['heavy hitters']]).groupby(level=0).sum()
+    return {
+        'games': sketch['games'] + other_sketch['games'],
+        'count min': sketch['count min'] + other_sketch['count min'],
+        'heavy hitters': reduce_heavy_hitters(heavy_hitters),
+        'hyperloglog': np.maximum(sketch['hyperloglog'], other_sketch['hyperloglog']),
+    }
+
+# the estimated games of values, the smallest count-min counter of each
+def count_min_estimate(sketch, values):
+    counters = [sketch['count min'][row][columns] for row, columns in enumerate(count_min_columns(values))]
+    return np.min(counters, axis=0) if counters else np.array([], dtype='int64')
+
+# the estimated distinct values, with linear counting while many registers are still empty
+def hyperloglog_estimate(sketch):
+    registers = sketch['hyperloglog']
+    size = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / size) * size ** 2 / np.sum(2.0 ** -registers.astype('float64'))
+    empty_registers = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * size and empty_registers:
+        estimate = size * np.log(size / empty_registers)
+    return int(round(estimate))
+
+# the heavy hitters and their estimated games, most first, like a frequency table of the most common values
+def sketch_frequency_table(sketch, column):
+    candidates = sketch['heavy hitters'].index
+    frequency_table = pd.Series(count_min_estimate(sketch, candidates), index=candidates, name='count', dtype='int64')
+    return frequency_table.rename_axis(column).sort_values(ascending=False, kind='stable')
+
+# the error bounds of the sketch of every column
+def sketch_bounds(sketches):
+    return {
+        column: {
+            'games': sketch['games'],
+            'distinct values': hyperloglog_estimate(sketch),
+            'distinct values error': HYPERLOGLOG_ERROR,
+            'count error': int(np.ceil(COUNT_MIN_EPSILON * sketch['games'])),
+            'count error probability': COUNT_MIN_DELTA,
+            'listed above': sketch['games'] // (HEAVY_HITTERS + 1),
+        }
+        for column, sketch in sketches.items()
+    }
+
+# print the distinct values and the error bounds of the approximate counts
+def print_sketch_bounds(sketches, report=None):
+    bounds = sketch_bounds(sketches)
+    table = pd.DataFrame({
+        'Distinct values': [f"{column_bounds['distinct values']} ± {column_bounds['distinct values error']:.1%}" for column_bounds in bounds.values()],
+        'Counts over by at most': [f"{column_bounds['count error']} ({1 - COUNT_MIN_DELTA:.1%} sure)" for column_bounds in bounds.values()],
+        'Lists every value above': [column_bounds['listed above'] for column_bounds in bounds.values()],
+    }, index=list(bounds))
+    report_print(report, "Approximate counts:")
+    report_print(report, table.to_string())
+    report_print(report, "The least common values aren't kept by the sketches.")
+    report_metric(report, "approximate counts", bounds)
+    end_report_section(report)
+
+# count a csv file in one pass over its chunks, exactly for the release dates and age ratings and
+# with the sketches for the other columns, and return the frequency tables
+def sketch_csv_file(file_name, chunksize=None, report=None):
+    logging.info("'sketch csv file' started.")
+    folded_counts = {column: {} for column in FREQUENCY_COLUMNS if column not in SKETCH_COLUMNS}
+    sketches = {column: new_sketch() for column in SKETCH_COLUMNS}
+
+    for chunk in pd.read_csv(file_name, dtype=CSV_DTYPES, chunksize=chunksize or OUT_OF_CORE_CHUNKSIZE):
+        clean_rows(chunk)
+        normalize_release_date(chunk)
+        fold_value_counts(folded_counts, chunk)
+        for column in SKETCH_COLUMNS:
+            sketches[column] = merge_sketches(sketches[column], sketch_values(chunk[column]))
+
+    print_sketch_bounds(sketches, report)
+
+    exact_tables = folded_frequency_tables(folded_counts)
+    frequency_tables = {
+        column: sketch_frequency_table(sketches[column], column) if column in SKETCH_COLUMNS else exact_tables[column]
+        for column in FREQUENCY_COLUMNS
+    }
+
+    logging.info(f"'sketch csv file' completed, {sketches[SKETCH_COLUMNS[0]]['games']} games.")
+    return frequency_tables
+
+# # # # # # # # # # # #
+#   CACHE             #
+# # # # # # # # # # # #
+
+# bump when the cleaning changes in a way the settings below don't show
+CACHE_VERSION = 5
+
+# where the cleaned dataframes are cached, next to this script
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# everything that changes the cleaned dataframe, part of the cache key
+def cleaning_config(near_duplicates=False):
+    return {
+        'version': CACHE_VERSION,
+        'removed columns': REMOVED_COLUMNS,
+        'renamed columns': RENAMED_COLUMNS,
+        'age rating mapping': AGE_RATING_MAPPING,
+        'categorical columns': CATEGORICAL_COLUMNS,
+        'near duplicates': {'edition tags': EDITION_TAGS} if near_duplicates else None,
+    }
+
+# hash the csv file and the cleaning settings
+def cache_key(file_name, near_duplicates=False):
+    file_hash = hashlib.sha256()
+    with open(file_name, 'rb') as csv_file:
+        for block in iter(lambda: csv_file.read(1024 * 1024), b''):
+            file_hash.update(block)
+    file_hash.update(json.dumps(cleaning_config(near_duplicates), sort_keys=True).encode())
+    return file_hash.hexdigest()[:16]
+
+# get the cache file of the cleaned dataframe, None when pyarrow isn't installed
+def get_cache_file(file_name, near_duplicates=False):
+    if importlib.util.find_spec('pyarrow') is None:
+        logging.info("'get cache file' pyarrow isn't installed, the cleaned data won't be cached.")
+        return None
+    return os.path.join(CACHE_DIRECTORY, f"{os.path.splitext(os.path.basename(file_name))[0]}_{cache_key(file_name, near_duplicates)}.feather")
+
+# save the cleaned dataframe, with its dtypes, the text and metrics of the report written while cleaning it and the
+# platform facts when they were built
+def save_cleaned_cache(df, cache_file, cleaning_report, platform_facts=None):
+    logging.info(f"'save cleaned cache' {cache_file} started.")
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    if platform_facts is not None:
+        save_platform_facts(platform_facts, get_platform_facts_file(cache_file))
+    cleaning_text, cleaning_metrics = cleaning_report
+    # every file is written to a temporary file and renamed into place, so a concurrent run never reads half of it
+    for extension, content in [("txt", cleaning_text), ("ndjson", cleaning_metrics)]:
+        report_file_name = f"{os.path.splitext(cache_file)[0]}.{extension}"
+        with open(f"{report_file_name}.{os.getpid()}.tmp", "w") as report_file:
+            report_file.write(content)
+        os.replace(f"{report_file_name}.{os.getpid()}.tmp", report_file_name)
+    # the feather file is written last, so it only exists once the entry is complete
+    df.to_feather(f"{cache_file}.{os.getpid()}.tmp")
+    os.replace(f"{cache_file}.{os.getpid()}.tmp", cache_file)
+    logging.info("'save cleaned cache' completed.")
+
+# # # # # # # # # # # #
+#   COLUMNAR STORE    #
+# # # # # # # # # # # #
+
+# The columnar store keeps the cleaned dataframe as one numpy file per column, next to the cache:
+# the string columns as integer codes into their labels, in the order the labels are first seen,
+# and the release months as int32 months since 1970, taken from the "Release Period" column of the
+# normalized release dates so the dates are never parsed again. Every run opens the files memory
+# mapped, so the runs on one host share the page cache instead of loading the data each, and the
+# frequency tables and the cross analysis cube are counted straight from the mapped codes. The
+# cleaned csv is kept in the store as well and copied to the output directory of every run.
+
+# bump when the store layout changes, it is part of the store directory
+STORE_VERSION = 3
+
+# the columns stored as int32 months since 1970
+STORE_PERIOD_COLUMNS = ['Release Period']
+
+# get the columnar store of a cache file, a directory next to it
+def get_columnar_store_directory(cache_file):
+    return f"{os.path.splitext(cache_file)[0]}_store{STORE_VERSION}"
+
+# the file name of a stored column, e.g. release_date
+def store_file_name(column):
+    return column.lower().replace(' ', '_')
+
+# save the cleaned dataframe, once its release dates are normalized, its cleaned csv and the report written
+# while cleaning it as a columnar store, written in a temporary directory and renamed into place so it only
+# exists once complete
+def save_columnar_store(df, store_directory, cleaning_report, cleaned_csv):
+    logging.info(f"'save columnar store' {store_directory} started.")
+    temporary_directory = f"{store_directory}.{os.getpid()}.tmp"
+    os.makedirs(temporary_directory, exist_ok=True)
+
+    columns = {}
+    for column in df.columns:
+        # the release year and month are parts of the release period
+        if column in RELEASE_DATE_DTYPES:
+            continue
+        if column in STORE_PERIOD_COLUMNS:
+            months = df[column].array.asi8.astype('int32')
+            np.save(os.path.join(temporary_directory, f"{store_file_name(column)}.npy"), months)
+            columns[column] = 'period'
+            continue
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            codes, labels = df[column].cat.codes.to_numpy(), df[column].cat.categories
+        else:
+            codes, labels = pd.factorize(df[column])
+        np.save(os.path.join(temporary_directory, f"{store_file_name(column)}.npy"), codes.astype(np.min_scalar_type(max(len(labels) - 1, 0))))
+        with open(os.path.join(temporary_directory, f"{store_file_name(column)}_labels.json"), "w") as labels_file:
+            json.dump([str(label) for label in labels], labels_file)
+        columns[column] = 'codes'
+
+    shutil.copyfile(cleaned_csv, os.path.join(temporary_directory, "cleaned.csv"))
+    cleaning_text, cleaning_metrics = cleaning_report
+    with open(os.path.join(temporary_directory, "cleaning_report.txt"), "w") as report_file:
+        report_file.write(cleaning_text)
+    with open(os.path.join(temporary_directory, "cleaning_report.ndjson"), "w") as metrics_file:
+        metrics_file.write(cleaning_metrics)
+    with open(os.path.join(temporary_directory, "store.json"), "w") as store_file:
+        json.dump({'rows': len(df), 'columns': columns}, store_file)
+
+    try:
+        os.rename(temporary_directory, store_directory)
+    except OSError:
+        # another run saved the same store first
+        shutil.rmtree(temporary_directory)
+    logging.info("'save columnar store' completed.")
+
+# open a columnar store, every column memory mapped
+def open_columnar_store(store_directory):
+    logging.info(f"'open columnar store' {store_directory} started.")
+    with open(os.path.join(store_directory, "store.json")) as store_file:
+        layout = json.load(store_file)
+    store = {
+        'directory': store_directory,
+        'rows': layout['rows'],
+        'kinds': layout['columns'],
+        'columns': {column: np.load(os.path.join(store_directory, f"{store_file_name(column)}.npy"), mmap_mode='r') for column in layout['columns']},
+        'labels': {},
+    }
+    logging.info("'open columnar store' completed.")
+    return store
+
+# the labels of a column of the store, read the first time they are needed
+def store_labels(store, column):
+    if column not in store['labels']:
+        with open(os.path.join(store['directory'], f"{store_file_name(column)}_labels.json")) as labels_file:
+            store['labels'][column] = pd.Index(json.load(labels_file), dtype='str', name=column)
+    return store['labels'][column]
+
+# the release months of the store, as month periods since 1970
+def store_release_periods(store):
+    return store['columns']['Release Period']
+
+# copy the cleaned csv kept in the store, a copy rather than a link since the incremental mode appends to
+# the cleaned csv of its output directory
+def copy_store_csv(store, cleaned_csv):
+    logging.info(f"'copy store csv' {cleaned_csv} started.")
+    shutil.copyfile(os.path.join(store['directory'], "cleaned.csv"), cleaned_csv)
+    logging.info("'copy store csv' completed.")
+
+# the cube dimensions of the store, the coded columns as categoricals over the mapped codes and the release
+# year and month from the stored months, to build the cube like the cleaned dataframe does
+def store_cube_dimensions(store):
+    logging.info("'store cube dimensions' started.")
+    months = store_release_periods(store)
+    df = pd.DataFrame({
+        'Release Year': (1970 + months // 12).astype(RELEASE_DATE_DTYPES['Release Year']),
+        'Release Month': (months % 12 + 1).astype(RELEASE_DATE_DTYPES['Release Month']),
+    })
+    for column in CUBE_DIMENSIONS:
+        if column not in df.columns:
+            df[column] = pd.Categorical.from_codes(store['columns'][column], categories=store_labels(store, column))
+    logging.info("'store cube dimensions' completed.")
+    return df[CUBE_DIMENSIONS]
+
+# count every analysed column from the mapped codes, the same tables build_frequency_tables gives
+def store_frequency_tables(store):
+    logging.info("'store frequency tables' started.")
+    frequency_tables = {}
+    for column in FREQUENCY_COLUMNS:
+        if column == 'Release Period':
+            codes, months = pd.factorize(store_release_periods(store))
+            labels = pd.PeriodIndex.from_ordinals(months, freq='M')
+        else:
+            codes, labels = store['columns'][column], store_labels(store, column)
+        counts = np.bincount(codes, minlength=len(labels))
+        frequency_table = pd.Series(counts, index=pd.Index(labels, name=column), name='count', dtype='int64')
+        frequency_tables[column] = frequency_table[frequency_table > 0].sort_values(ascending=False, kind='stable')
+    logging.info("'store frequency tables' completed.")
+    return frequency_tables
+
+# open the columnar store of a csv file cleaned earlier and write the report of its cleaning
+def start_columnar_store(file_name, store_directory, report=None):
+    logging.info(f"'start columnar store' {file_name} from {store_directory} started.")
+    store = open_columnar_store(store_directory)
+    with open(os.path.join(store_directory, "cleaning_report.txt")) as cleaning_report, open(os.path.join(store_directory, "cleaning_report.ndjson")) as cleaning_metrics:
+        write_report(report, cleaning_report.read(), cleaning_metrics.read())
+    logging.info("'start columnar store' completed.")
+    return store
+
+# # # # # # # # # # # #
+#   INCREMENTAL       #
+# # # # # # # # # # # #
+
+# The incremental state keeps what a run needs to add the rows appended to a csv file since the
+# last run: how many bytes of the csv file were read and their hash, the running counts of every
+# analysed column, the missing values and duplicate rows dropped so far, whether the charts show the counts and the
+# 64-bit hash of every distinct row, stored next to the state file. The release year and month matrix is the "Release Period" counts.
+
+# bump when the state file layout changes
+STATE_VERSION = 4
+
+# the csv file is hashed in blocks of this many bytes
+STATE_BLOCK_SIZE = 1024 * 1024
+
+# a state that hasn't read any of the csv file yet
+def new_incremental_state():
+    return {
+        'version': STATE_VERSION,
+        'cleaning config': cleaning_config(),
+        'columns': None,
+        'consumed bytes': 0,
+        'consumed sha256': hashlib.sha256().hexdigest(),
+        'cleaned csv bytes': 0,
+        'missing values': {},
+        'removed rows': {'exact row': 0},
+        'counts': {column: {} for column in FREQUENCY_COLUMNS},
+        'row hashes': no_row_hashes(),
+        'charts drawn': False,
+    }
+
+# the row hash index stored next to the state file
+def get_row_hashes_file(state_file):
+    return f"{os.path.splitext(state_file)[0]}_row_hashes.npy"
+
+# read the state and its row hash index, a new state when there is none or it can't be used
+def load_incremental_state(state_file):
+    logging.info(f"'load incremental state' {state_file} started.")
+    if not os.path.isfile(state_file):
+        return new_incremental_state()
+
+    with open(state_file) as state_json:
+        state = json.load(state_json)
+    if state['version'] != STATE_VERSION or state['cleaning config'] != json.loads(json.dumps(cleaning_config())):
+        logging.info("'load incremental state' the cleaning settings changed, starting over.")
+        return new_incremental_state()
+
+    row_hashes_file = get_row_hashes_file(state_file)
+    row_hashes = np.load(row_hashes_file) if os.path.isfile(row_hashes_file) else None
+    if row_hashes is None or hashlib.sha256(row_hashes.tobytes()).hexdigest() != state.pop('row hashes sha256'):
+        logging.info("'load incremental state' the row hash index doesn't match the state, starting over.")
+        return new_incremental_state()
+
+    state['row hashes'] = row_hashes
+    state['counts']['Release Period'] = {pd.Period(period, freq='M'): count for period, count in state['counts']['Release Period'].items()}
+    logging.info("'load incremental state' completed.")
+    return state
+
+# hash the next size bytes of a file, or up to its end when size is None, and return how many were read
+def hash_file_bytes(binary_file, file_hash, size=None):
+    hashed_bytes = 0
+    while size is None or hashed_bytes < size:
+        block = binary_file.read(STATE_BLOCK_SIZE if size is None else min(STATE_BLOCK_SIZE, size - hashed_bytes))
+        if not block:
+            break
+        file_hash.update(block)
+        hashed_bytes += len(block)
+    return hashed_bytes
+
+# whether the cleaned csv still holds the rows of the earlier runs, cutting off the rows a run that
+# didn't finish appended to it
+def cleaned_csv_matches(state, cleaned_csv):
+    if not os.path.isfile(cleaned_csv) or os.path.getsize(cleaned_csv) < state['cleaned csv bytes']:
+        return False
+    os.truncate(cleaned_csv, state['cleaned csv bytes'])
+    return True
+
+# clean the rows appended to the csv file since the last run, append them to the cleaned csv and add
+# them to the state, starting over when the part of the csv file read before has changed
+def append_new_rows(state, file_name, cleaned_csv, chunksize=None, report=None):
+    logging.info(f"'append new rows' {file_name} started.")
+    new_rows = 0
+
+    with open(file_name, 'rb') as csv_file:
+        file_hash = hashlib.sha256()
+        consumed_bytes = hash_file_bytes(csv_file, file_hash, state['consumed bytes'])
+        if state['consumed bytes'] and (consumed_bytes < state['consumed bytes'] or file_hash.hexdigest() != state['consumed sha256'] or not cleaned_csv_matches(state, cleaned_csv)):
+            logging.info("'append new rows' the csv file or the cleaned csv changed, starting over.")
+            state.clear()
+            state.update(new_incremental_state())
+            file_hash = hashlib.sha256()
+            csv_file.seek(0)
+        appended_bytes = hash_file_bytes(csv_file, file_hash)
+
+        if appended_bytes:
+            csv_file.seek(state['consumed bytes'])
+            # only the first run reads the header, later runs start in the middle of the file
+            if state['columns'] is None:
+                rows = pd.read_csv(csv_file, dtype=CSV_DTYPES, chunksize=chunksize)
+            else:
+                rows = pd.read_csv(csv_file, header=None, names=state['columns'], dtype=CSV_DTYPES, chunksize=chunksize)
+
+            for chunk in (rows if chunksize else [rows]):
+                if state['columns'] is None:
+                    state['columns'] = list(chunk.columns)
+                chunk_missing_values, duplicate_rows = clean_chunk(chunk, state)
+                for column, missing in chunk_missing_values.items():
+                    state['missing values'][column] = state['missing values'].get(column, 0) + int(missing)
+                state['removed rows']['exact row'] += duplicate_rows
+                header = not state['cleaned csv bytes']
+                chunk.to_csv(cleaned_csv, mode='w' if header else 'a', header=header, index=False)
+                state['cleaned csv bytes'] = os.path.getsize(cleaned_csv)
+                normalize_release_date(chunk)
+                fold_value_counts(state['counts'], chunk)
+                new_rows += len(chunk)
+
+        state['consumed bytes'] += appended_bytes
+        state['consumed sha256'] = file_hash.hexdigest()
+
+    # the sections count every row read so far, like a run on the whole csv file
+    if state['missing values']:
+        print_missing_values(pd.Series(state['missing values'], dtype='int64'), report)
+        print_removed_duplicates(state['removed rows'], report)
+
+    logging.info(f"'append new rows' completed, {new_rows} new distinct rows, {len(state['row hashes'])} in total.")
+    return new_rows
+
+# the frequency tables of the state
+def incremental_frequency_tables(state):
+    return folded_frequency_tables(state['counts'])
+
+# save the state, the row hash index first and the state file last, each written to a tmp file and
+# renamed into place, a state file that doesn't match its row hash index makes the next run start over
+def save_incremental_state(state, state_file):
+    logging.info(f"'save incremental state' {state_file} started.")
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+
+    row_hashes = state['row hashes']
+    row_hashes_file = get_row_hashes_file(state_file)
+    with open(f"{row_hashes_file}.{os.getpid()}.tmp", 'wb') as row_hashes_npy:
+        np.save(row_hashes_npy, row_hashes)
+    os.replace(f"{row_hashes_file}.{os.getpid()}.tmp", row_hashes_file)
+
+    saved_state = {key: value for key, value in state.items() if key != 'row hashes'}
+    saved_state['row hashes sha256'] = hashlib.sha256(row_hashes.tobytes()).hexdigest()
+    saved_state['counts'] = {column: {str(value): int(count) for value, count in counts.items()} for column, counts in state['counts'].items()}
+    with open(f"{state_file}.{os.getpid()}.tmp", 'w') as state_json:
+        json.dump(saved_state, state_json)
+    os.replace(f"{state_file}.{os.getpid()}.tmp", state_file)
+    logging.info("'save incremental state' completed.")
+
+# # # # # # # # # # # #
+#   EXPORT            #
+# # # # # # # # # # # #
+
+# rows read at a time from the cleaned csv when writing the xlsx file
+XLSX_CHUNKSIZE = 10000
+
+# write the cleaned csv to an xlsx file, one chunk at a time through openpyxl's write-only workbook
+# that streams the rows to disk, returns the seconds it took
+def export_xlsx(cleaned_csv, cleaned_xlsx):
+    from openpyxl import Workbook
+    start = time.perf_counter()
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Sheet1')
+    header = True
+
+    for chunk in pd.read_csv(cleaned_csv, chunksize=XLSX_CHUNKSIZE, dtype=str, keep_default_na=False):
+        if header:
+            worksheet.append(list(chunk.columns))
+            header = False
+        for row in chunk.itertuples(index=False, name=None):
+            worksheet.append(row)
+
+    workbook.save(cleaned_xlsx)
+    return time.perf_counter() - start
+
+# start writing the xlsx file in a background process, so it overlaps the analysis and the charts
+def start_xlsx_export(cleaned_csv, cleaned_xlsx):
+    logging.info(f"'start xlsx export' {cleaned_xlsx} started.")
+    executor = ProcessPoolExecutor(max_workers=1)
+    future = executor.submit(export_xlsx, cleaned_csv, cleaned_xlsx)
+    logging.info("'start xlsx export' completed.")
+    return executor, future
+
+# wait for the xlsx file and report how long it took, in the stage metrics as well when given
+def finish_xlsx_export(xlsx_export, stage_metrics=None):
+    logging.info("'finish xlsx export' started.")
+    executor, future = xlsx_export
+    try:
+        elapsed = future.result()
+    finally:
+        executor.shutdown()
+    if stage_metrics is not None:
+        stage_metrics['background']['export xlsx'] = {'wall time': round(elapsed, 6)}
+    logging.info(f"'finish xlsx export' completed, the xlsx file took {elapsed:.2f} seconds.")
+
+# # # # # # # # # # # #
+#   CHART TEMPLATE    #
+# # # # # # # # # # # #
+
+# how the charts are saved, the fast settings are for bulk report generation
+CHART_SAVE_SETTINGS = {'dpi': 300, 'bbox_inches': 'tight'}
+FAST_CHART_SAVE_SETTINGS = {'dpi': 100}
+
+# import matplotlib and seaborn, once per process
+def load_plotting():
+    global plt, sns, Figure, FigureCanvasAgg
+    if sns is not None:
+        return
+    logging.info("'load plotting' started.")
+    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import seaborn as sns
+    logging.info("'load plotting' completed.")
+
+# a figure in the dark chart style that is saved to png_file_name and always closed,
+# the fast path draws on a plain Agg figure that pyplot never keeps track of
+@contextmanager
+def chart_figure(png_file_name, fast=False, nrows=1, figsize=(12, 6)):
+    load_plotting()
+    with plt.style.context('dark_background'):
+        if fast:
+            fig = Figure(figsize=figsize)
+            FigureCanvasAgg(fig)
+            axes = fig.subplots(nrows, 1)
+        else:
+            fig, axes = plt.subplots(nrows, 1, figsize=figsize)
+
+        try:
+            yield fig, axes
+            fig.savefig(png_file_name, **(FAST_CHART_SAVE_SETTINGS if fast else CHART_SAVE_SETTINGS))
+        finally:
+            if not fast:
+                plt.close(fig)
+
+# the title, labels, grid and ticks shared by every chart
+def style_axes(ax, title, xlabel):
+    ax.set_title(title, fontsize=16, color='white')
+    ax.set_xlabel(xlabel, fontsize=12, color='white')
+    ax.set_ylabel("Games", fontsize=12, color='white')
+
+    ax.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
+    ax.tick_params(axis='x', colors='white')
+    ax.tick_params(axis='y', colors='white')
+
+# write the number of games on top of each bar
+def label_bars(ax, bars):
+    for bar in bars:
+        yval = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
+
+# a bar chart of a frequency table
+def bar_panel(ax, value_counts, title, xlabel):
+    bars = ax.bar(value_counts.index, value_counts, color=sns.color_palette("viridis", len(value_counts)))
+    plt.setp(ax.xaxis.get_majorticklabels(), rotation=30, ha='right')
+    style_axes(ax, title, xlabel)
+    label_bars(ax, bars)
+
+# draw one chart into a temporary directory and return the png, for the callers that send the chart
+# instead of writing it, run it in a worker process because matplotlib can't draw from several threads
+def render_chart_png(chart, chart_table, fast=False):
+    with tempfile.TemporaryDirectory() as chart_directory:
+        chart(chart_table, os.path.join(chart_directory, "chart.csv"), fast)
+        png_file_name, = glob.glob(os.path.join(chart_directory, "*.png"))
+        with open(png_file_name, "rb") as png_file:
+            return png_file.read()
+
 # # # # # # # # # # # #
 #   TITLE             #
 # # # # # # # # # # # #
 
 # the sum of all the games
-def total_games(df):
+def total_games(df, report=None):
     logging.info("'total games' started.")
-    total_games = df["Title"].count()
-    print(f"The total games made is: {total_games:.0f}")
+    if isinstance(df, dict):
+        # every cleaned row has a title, so the release month counts add up to the games
+        total_games = get_value_counts(df, "Release Period").sum()
+    else:
+        total_games = df["Title"].count()
+    report_print(report, f"The total games made is: {total_games:.0f}")
+    report_metric(report, "total games", total_games)
     logging.info("'total games' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # # # # # # # # # # # #
 #   RELEASE DATE      #
 # # # # # # # # # # # #
 
+# the format of the "Release Date" column, e.g. 11/14/2006
+RELEASE_DATE_FORMAT = '%m/%d/%Y'
+
+# the small integer types of the release date parts
+RELEASE_DATE_DTYPES = {'Release Year': 'int16', 'Release Month': 'int8'}
+
+# parse the "Release Date" column once and keep its year, month and month period
+def normalize_release_date(df):
+    logging.info("'normalize release date' started.")
+    release_dates = pd.to_datetime(df['Release Date'], format=RELEASE_DATE_FORMAT)
+    df['Release Year'] = release_dates.dt.year.astype(RELEASE_DATE_DTYPES['Release Year'])
+    df['Release Month'] = release_dates.dt.month.astype(RELEASE_DATE_DTYPES['Release Month'])
+    df['Release Period'] = release_dates.dt.to_period('M')
+    logging.info("'normalize release date' completed.")
+
+# counts the games by release month, with the year, month and month name of each
+def get_release_date_counts(df):
+    release_period_counts = get_value_counts(df, "Release Period")
+    release_periods = pd.PeriodIndex(release_period_counts.index, freq='M')
+    return pd.DataFrame({
+        'Release Year': release_periods.year,
+        'Release Month': release_periods.month,
+        'Release Month Name': release_periods.strftime('%B %Y'),
+        'Games': release_period_counts.to_numpy(),
+    })
+
+# counts the games by release month name, e.g. November 2006
+def get_release_month_counts(df):
+    return get_release_date_counts(df).groupby('Release Month Name', sort=False)['Games'].sum()
+
 # counts all the games by release date
-def count_release_date(df):
+def count_release_date(df, report=None):
     logging.info("'count release date' started.")
-    df['Release Date'] = pd.to_datetime(df['Release Date'])
-    df['Release Year'] = df['Release Date'].dt.year
-    df['Release Month'] = df['Release Date'].dt.month
-    monthly_counts = df.groupby(['Release Year', 'Release Month']).size().unstack()
-    # count_release_date = df.groupby(['Release Year', 'Release Month']).value_counts()
-    # count_release_date.index.name = None
-    print("Games by release year and month:")
-    print(monthly_counts.to_string())
+    release_date_counts = get_release_date_counts(df)
+    monthly_counts = release_date_counts.groupby(['Release Year', 'Release Month'])['Games'].sum().unstack()
+    report_print(report, "Games by release year and month:")
+    report_print(report, monthly_counts.to_string())
+    report_metric(report, "games by release year and month", release_date_counts[['Release Year', 'Release Month', 'Games']].to_dict('records'))
     logging.info("'count release date' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the most common release date
-def most_common_release_date(df):
+def most_common_release_date(df, report=None):
     logging.info("'most common release date' started.")
-    df['Release Date'] = pd.to_datetime(df['Release Date'])
-    df['Release Year'] = df['Release Date'].dt.year
-    df['Release Month'] = df['Release Date'].dt.strftime('%B %Y')
-    most_common_release_date = df["Release Month"].mode().iloc[0]
-    print(f"The most common release date is: {most_common_release_date}")
+    release_month_counts = get_release_month_counts(df)
+    most_common_release_date = most_common_value(release_month_counts)
+    report_print(report, f"The most common release date is: {most_common_release_date}")
+    report_metric(report, "most common release date", {'value': most_common_release_date, 'games': release_month_counts[most_common_release_date]})
     logging.info("'most common release date' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the least common release date
-def least_common_release_date(df):
+def least_common_release_date(df, report=None):
     logging.info("'least common release date' started.")
-    df['Release Date'] = pd.to_datetime(df['Release Date'])
-    df['Release Year'] = df['Release Date'].dt.year
-    df['Release Month'] = df['Release Date'].dt.strftime('%B %Y')
-    least_common_release_date = min(df["Release Month"].unique(), key=df["Release Month"].tolist().count)
-    print(f"The least common release date is: {least_common_release_date}")
+    release_month_counts = get_release_month_counts(df)
+    least_common_release_date = least_common_value(release_month_counts)
+    report_print(report, f"The least common release date is: {least_common_release_date}")
+    report_metric(report, "least common release date", {'value': least_common_release_date, 'games': release_month_counts[least_common_release_date]})
     logging.info("'least common release date' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # release date year bar chart
-def release_date_year_bar_chart(df, file_name):
+def release_date_year_bar_chart(df, file_name, fast=False):
     logging.info("'release date year bar chart' started.")
 
-    df['Release Year'] = pd.to_datetime(df['Release Date']).dt.year
-    release_year_count = df['Release Year'].value_counts().sort_index()
-
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(12, 6))
-
-    bar_colors = sns.color_palette("viridis", len(release_year_count))
-    bars = ax.bar(release_year_count.index.astype(int), release_year_count, color=bar_colors)
+    release_year_count = get_release_date_counts(df).groupby('Release Year')['Games'].sum()
 
-    plt.setp(ax.xaxis.get_majorticklabels(), rotation=30, ha='right')
+    png_file_name = f"{os.path.splitext(file_name)[0]}_release_date_year.png"
+    with chart_figure(png_file_name, fast, figsize=(12, 6)) as (fig, ax):
+        bars = ax.bar(release_year_count.index.astype(int), release_year_count, color=sns.color_palette("viridis", len(release_year_count)))
 
-    plt.xticks(release_year_count.index.astype(int), rotation=45)
+        plt.setp(ax.xaxis.get_majorticklabels(), rotation=30, ha='right')
 
-    ax.set_title("Games Released by Year", fontsize=16, color='white')
-    ax.set_xlabel("Year", fontsize=12, color='white')
-    ax.set_ylabel("Games", fontsize=12, color='white')
+        ax.set_xticks(release_year_count.index.astype(int))
+        plt.setp(ax.get_xticklabels(), rotation=45)
 
-    ax.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax.tick_params(axis='x', colors='white')
-    ax.tick_params(axis='y', colors='white')
-
-    for bar in bars:
-        yval = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
+        style_axes(ax, "Games Released by Year", "Year")
+        label_bars(ax, bars)
 
-    png_file_name = f"{os.path.splitext(file_name)[0]}_release_date_year.png"
-    plt.savefig(png_file_name, bbox_inches='tight', dpi=300)
     logging.info("'release date year bar chart' completed.")
 
 # release date month line chart
-def release_date_month_line_chart(df, file_name):
+def release_date_month_line_chart(df, file_name, fast=False):
     logging.info("'release date month line chart' started.")
 
-    df['Release Year'] = pd.to_datetime(df['Release Date']).dt.year
-
-    plt.style.use('dark_background')
-
-    monthly_counts = df.groupby(['Release Year', pd.to_datetime(df['Release Date']).dt.month]).size().unstack()
+    monthly_counts = get_release_date_counts(df).groupby(['Release Year', 'Release Month'])['Games'].sum().unstack()
 
-    fig, ax = plt.subplots(figsize=(12, 6))
-
-    line_colors = sns.color_palette("viridis", len(monthly_counts))
-
-    for year, color in zip(monthly_counts.index, line_colors):
-        ax.plot(monthly_counts.columns, monthly_counts.loc[year], marker='o', label=year, color=color)
+    png_file_name = f"{os.path.splitext(file_name)[0]}_release_date_month.png"
+    with chart_figure(png_file_name, fast, figsize=(12, 6)) as (fig, ax):
+        line_colors = sns.color_palette("viridis", len(monthly_counts))
 
-    plt.setp(ax.xaxis.get_majorticklabels(), rotation=30, ha='right')
+        for year, color in zip(monthly_counts.index, line_colors):
+            ax.plot(monthly_counts.columns, monthly_counts.loc[year], marker='o', label=year, color=color)
 
-    ax.set_xticks(monthly_counts.columns)
-    ax.set_xticklabels(['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December'])
+        plt.setp(ax.xaxis.get_majorticklabels(), rotation=30, ha='right')
 
-    ax.set_title("Games Released by Month", fontsize=16, color='white')
-    ax.set_xlabel("Month", fontsize=12, color='white')
-    ax.set_ylabel("Games", fontsize=12, color='white')
+        ax.set_xticks(monthly_counts.columns)
+        ax.set_xticklabels(['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December'])
 
-    ax.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax.tick_params(axis='x', colors='white')
-    ax.tick_params(axis='y', colors='white')
+        style_axes(ax, "Games Released by Month", "Month")
 
-    ax.legend(loc='upper left', bbox_to_anchor=(1, 1), title='Year', title_fontsize='12', facecolor='black', edgecolor='white')
+        ax.legend(loc='upper left', bbox_to_anchor=(1, 1), title='Year', title_fontsize='12', facecolor='black', edgecolor='white')
 
-    png_file_name = f"{os.path.splitext(file_name)[0]}_release_date_month.png"
-    plt.savefig(png_file_name, bbox_inches='tight', dpi=300)
     logging.info(f"'release date month line chart' completed.")
 
 # # # # # # # # # # # #
@@ -292,82 +1747,47 @@ def release_date_month_line_chart(df, file_name):
 # # # # # # # # # # # #
 
 # counts all the games by developer
-def count_developer(df):
+def count_developer(df, report=None):
     logging.info("'count developer' started.")
-    count_developer = df["Developer"].value_counts()
-    count_developer.index.name = None
-    print("Games by developer:")
-    print(count_developer.to_string(name=False))
+    count_developer = get_value_counts(df, "Developer").rename_axis(None)
+    report_print(report, "Games by developer:")
+    report_print(report, count_developer.to_string(name=False))
+    report_metric(report, "games by developer", counts_metric(count_developer))
     logging.info("'count developer' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the most common developer
-def most_common_developer(df):
+def most_common_developer(df, report=None):
     logging.info("'most common developer' started.")
-    most_common_developer = df["Developer"].mode().iloc[0]
-    print(f"The most common developer is: {most_common_developer}")
+    developer_counts = get_value_counts(df, "Developer")
+    most_common_developer = most_common_value(developer_counts)
+    report_print(report, f"The most common developer is: {most_common_developer}")
+    report_metric(report, "most common developer", {'value': most_common_developer, 'games': developer_counts[most_common_developer]})
     logging.info("'most common developer' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the least common developer
-def least_common_developer(df):
+def least_common_developer(df, report=None):
     logging.info("'least common developer' started.")
-    least_common_developer = min(df["Developer"].unique(), key=df["Developer"].tolist().count)
-    print(f"The least common developer is: {least_common_developer}")
+    developer_counts = get_value_counts(df, "Developer")
+    least_common_developer = least_common_value(developer_counts)
+    report_print(report, f"The least common developer is: {least_common_developer}")
+    report_metric(report, "least common developer", {'value': least_common_developer, 'games': developer_counts[least_common_developer]})
     logging.info("'least common developer' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # developer bar chart
-def developer_bar_chart(df, file_name):
+def developer_bar_chart(df, file_name, fast=False):
     logging.info("'developer bar chart' started.")
 
-    developer_count_top = df['Developer'].value_counts().head(10)
-    developer_count_bottom = df['Developer'].value_counts().tail(10)
-
-    plt.style.use('dark_background')
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 12))
-
-    bar_colors_top = sns.color_palette("viridis", len(developer_count_top))
-    bars_top = ax1.bar(developer_count_top.index, developer_count_top, color=bar_colors_top)
-
-    plt.setp(ax1.xaxis.get_majorticklabels(), rotation=30, ha='right')
-
-    ax1.set_title("Top 10 Developers", fontsize=16, color='white')
-    ax1.set_xlabel("Developer", fontsize=12, color='white')
-    ax1.set_ylabel("Games", fontsize=12, color='white')
-
-    ax1.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax1.tick_params(axis='x', colors='white')
-    ax1.tick_params(axis='y', colors='white')
-
-    for bar in bars_top:
-        yval = bar.get_height()
-        ax1.text(bar.get_x() + bar.get_width() / 2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
-
-    bar_colors_bottom = sns.color_palette("viridis", len(developer_count_bottom))
-    bars_bottom = ax2.bar(developer_count_bottom.index, developer_count_bottom, color=bar_colors_bottom)
-
-    plt.setp(ax2.xaxis.get_majorticklabels(), rotation=30, ha='right')
-
-    ax2.set_title("Bottom 10 Developers", fontsize=16, color='white')
-    ax2.set_xlabel("Developer", fontsize=12, color='white')
-    ax2.set_ylabel("Games", fontsize=12, color='white')
-
-    ax2.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax2.tick_params(axis='x', colors='white')
-    ax2.tick_params(axis='y', colors='white')
-
-    for bar in bars_bottom:
-        yval = bar.get_height()
-        ax2.text(bar.get_x() + bar.get_width() / 2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
-
-    plt.subplots_adjust(hspace=0.5)
+    developer_count = get_value_counts(df, 'Developer')
 
     png_file_name = f"{os.path.splitext(file_name)[0]}_developer.png"
-    plt.savefig(png_file_name, bbox_inches='tight', dpi=300)
+    with chart_figure(png_file_name, fast, nrows=2, figsize=(12, 12)) as (fig, (ax1, ax2)):
+        bar_panel(ax1, developer_count.head(10), "Top 10 Developers", "Developer")
+        bar_panel(ax2, developer_count.tail(10), "Bottom 10 Developers", "Developer")
+        fig.subplots_adjust(hspace=0.5)
+
     logging.info("'developer bar chart' completed.")
 
 # # # # # # # # # # # #
@@ -375,82 +1795,47 @@ def developer_bar_chart(df, file_name):
 # # # # # # # # # # # #
 
 # counts all the games by publisher
-def count_publisher(df):
+def count_publisher(df, report=None):
     logging.info("'count publisher' started.")
-    count_publisher = df["Publisher"].value_counts()
-    count_publisher.index.name = None
-    print("Games by publisher:")
-    print(count_publisher.to_string(name=False))
+    count_publisher = get_value_counts(df, "Publisher").rename_axis(None)
+    report_print(report, "Games by publisher:")
+    report_print(report, count_publisher.to_string(name=False))
+    report_metric(report, "games by publisher", counts_metric(count_publisher))
     logging.info("'count publisher' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the most common publisher
-def most_common_publisher(df):
+def most_common_publisher(df, report=None):
     logging.info("'most common publisher' started.")
-    most_common_publisher = df["Publisher"].mode().iloc[0]
-    print(f"The most common publisher is: {most_common_publisher}")
+    publisher_counts = get_value_counts(df, "Publisher")
+    most_common_publisher = most_common_value(publisher_counts)
+    report_print(report, f"The most common publisher is: {most_common_publisher}")
+    report_metric(report, "most common publisher", {'value': most_common_publisher, 'games': publisher_counts[most_common_publisher]})
     logging.info("'most common publisher' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the least common publisher
-def least_common_publisher(df):
+def least_common_publisher(df, report=None):
     logging.info("'least common publisher' started.")
-    least_common_publisher = min(df["Publisher"].unique(), key=df["Publisher"].tolist().count)
-    print(f"The least common publisher is: {least_common_publisher}")
+    publisher_counts = get_value_counts(df, "Publisher")
+    least_common_publisher = least_common_value(publisher_counts)
+    report_print(report, f"The least common publisher is: {least_common_publisher}")
+    report_metric(report, "least common publisher", {'value': least_common_publisher, 'games': publisher_counts[least_common_publisher]})
     logging.info("'least common publisher' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # publisher bar chart
-def publisher_bar_chart(df, file_name):
+def publisher_bar_chart(df, file_name, fast=False):
     logging.info("'publisher bar chart' started.")
 
-    top_publisher_count = df['Publisher'].value_counts().head(10)
-    bottom_publisher_count = df['Publisher'].value_counts().tail(10)
-
-    plt.style.use('dark_background')
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 12))
-
-    bar_colors_top = sns.color_palette("viridis", len(top_publisher_count))
-    bars_top = ax1.bar(top_publisher_count.index, top_publisher_count, color=bar_colors_top)
-
-    plt.setp(ax1.xaxis.get_majorticklabels(), rotation=30, ha='right')
-
-    ax1.set_title("Top 10 Publishers", fontsize=16, color='white')
-    ax1.set_xlabel("Publisher", fontsize=12, color='white')
-    ax1.set_ylabel("Games", fontsize=12, color='white')
-
-    ax1.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax1.tick_params(axis='x', colors='white')
-    ax1.tick_params(axis='y', colors='white')
-
-    for bar in bars_top:
-        yval = bar.get_height()
-        ax1.text(bar.get_x() + bar.get_width() / 2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
-
-    bar_colors_bottom = sns.color_palette("viridis", len(bottom_publisher_count))
-    bars_bottom = ax2.bar(bottom_publisher_count.index, bottom_publisher_count, color=bar_colors_bottom)
-
-    plt.setp(ax2.xaxis.get_majorticklabels(), rotation=30, ha='right')
-
-    ax2.set_title("Bottom 10 Publishers", fontsize=16, color='white')
-    ax2.set_xlabel("Publisher", fontsize=12, color='white')
-    ax2.set_ylabel("Games", fontsize=12, color='white')
-
-    ax2.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax2.tick_params(axis='x', colors='white')
-    ax2.tick_params(axis='y', colors='white')
-
-    for bar in bars_bottom:
-        yval = bar.get_height()
-        ax2.text(bar.get_x() + bar.get_width() / 2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
-
-    plt.subplots_adjust(hspace=0.5)
+    publisher_count = get_value_counts(df, 'Publisher')
 
     png_file_name = f"{os.path.splitext(file_name)[0]}_publisher.png"
-    plt.savefig(png_file_name, bbox_inches='tight', dpi=300)
+    with chart_figure(png_file_name, fast, nrows=2, figsize=(12, 12)) as (fig, (ax1, ax2)):
+        bar_panel(ax1, publisher_count.head(10), "Top 10 Publishers", "Publisher")
+        bar_panel(ax2, publisher_count.tail(10), "Bottom 10 Publishers", "Publisher")
+        fig.subplots_adjust(hspace=0.5)
+
     logging.info("'publisher bar chart' completed.")
 
 # # # # # # # # # # # #
@@ -458,82 +1843,47 @@ def publisher_bar_chart(df, file_name):
 # # # # # # # # # # # #
 
 # counts all the games by genre
-def count_genre(df):
+def count_genre(df, report=None):
     logging.info("'count genre' started.")
-    count_genre = df["Genre"].value_counts()
-    count_genre.index.name = None
-    print("Games by genre:")
-    print(count_genre.to_string(name=False))
+    count_genre = get_value_counts(df, "Genre").rename_axis(None)
+    report_print(report, "Games by genre:")
+    report_print(report, count_genre.to_string(name=False))
+    report_metric(report, "games by genre", counts_metric(count_genre))
     logging.info("'count genre' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the most common genre
-def most_common_genre(df):
+def most_common_genre(df, report=None):
     logging.info("'most common genre' started.")
-    most_common_genre = df["Genre"].mode().iloc[0]
-    print(f"The most common genre is: {most_common_genre}")
+    genre_counts = get_value_counts(df, "Genre")
+    most_common_genre = most_common_value(genre_counts)
+    report_print(report, f"The most common genre is: {most_common_genre}")
+    report_metric(report, "most common genre", {'value': most_common_genre, 'games': genre_counts[most_common_genre]})
     logging.info("'most common genre' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the least common genre
-def least_common_genre(df):
+def least_common_genre(df, report=None):
     logging.info("'least common genre' started.")
-    least_common_genre = min(df["Genre"].unique(), key=df["Genre"].tolist().count)
-    print(f"The least common genre is: {least_common_genre}")
+    genre_counts = get_value_counts(df, "Genre")
+    least_common_genre = least_common_value(genre_counts)
+    report_print(report, f"The least common genre is: {least_common_genre}")
+    report_metric(report, "least common genre", {'value': least_common_genre, 'games': genre_counts[least_common_genre]})
     logging.info("'least common genre' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # genre bar chart
-def genre_bar_chart(df, file_name):
+def genre_bar_chart(df, file_name, fast=False):
     logging.info("'genre bar chart' started.")
 
-    top_genre_count = df['Genre'].value_counts().head(10)
-    bottom_genre_count = df['Genre'].value_counts().tail(10)
-
-    plt.style.use('dark_background')
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 12))
-
-    bar_colors_top = sns.color_palette("viridis", len(top_genre_count))
-    bars_top = ax1.bar(top_genre_count.index, top_genre_count, color=bar_colors_top)
-
-    plt.setp(ax1.xaxis.get_majorticklabels(), rotation=30, ha='right')
-
-    ax1.set_title("Top 10 Genre", fontsize=16, color='white')
-    ax1.set_xlabel("Genre", fontsize=12, color='white')
-    ax1.set_ylabel("Games", fontsize=12, color='white')
-
-    ax1.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax1.tick_params(axis='x', colors='white')
-    ax1.tick_params(axis='y', colors='white')
-
-    for bar in bars_top:
-        yval = bar.get_height()
-        ax1.text(bar.get_x() + bar.get_width() / 2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
-
-    bar_colors_bottom = sns.color_palette("viridis", len(bottom_genre_count))
-    bars_bottom = ax2.bar(bottom_genre_count.index, bottom_genre_count, color=bar_colors_bottom)
-
-    plt.setp(ax2.xaxis.get_majorticklabels(), rotation=30, ha='right')
-
-    ax2.set_title("Bottom 10 Genre", fontsize=16, color='white')
-    ax2.set_xlabel("Publisher", fontsize=12, color='white')
-    ax2.set_ylabel("Games", fontsize=12, color='white')
-
-    ax2.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax2.tick_params(axis='x', colors='white')
-    ax2.tick_params(axis='y', colors='white')
-
-    for bar in bars_bottom:
-        yval = bar.get_height()
-        ax2.text(bar.get_x() + bar.get_width() / 2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
-
-    plt.subplots_adjust(hspace=0.5)
+    genre_count = get_value_counts(df, 'Genre')
 
     png_file_name = f"{os.path.splitext(file_name)[0]}_genre.png"
-    plt.savefig(png_file_name, bbox_inches='tight', dpi=300)
+    with chart_figure(png_file_name, fast, nrows=2, figsize=(12, 12)) as (fig, (ax1, ax2)):
+        bar_panel(ax1, genre_count.head(10), "Top 10 Genre", "Genre")
+        bar_panel(ax2, genre_count.tail(10), "Bottom 10 Genre", "Genre")
+        fig.subplots_adjust(hspace=0.5)
+
     logging.info("'genre bar chart' completed.")
 
 # # # # # # # # # # # #
@@ -541,62 +1891,45 @@ def genre_bar_chart(df, file_name):
 # # # # # # # # # # # #
 
 # counts all the games by age rating
-def count_age_rating(df):
+def count_age_rating(df, report=None):
     logging.info("'count age rating' started.")
-    count_age_rating = df["Age Rating"].value_counts()
-    count_age_rating.index.name = None
-    print("Games by age rating:")
-    print(count_age_rating.to_string(name=False))
+    count_age_rating = get_value_counts(df, "Age Rating").rename_axis(None)
+    report_print(report, "Games by age rating:")
+    report_print(report, count_age_rating.to_string(name=False))
+    report_metric(report, "games by age rating", counts_metric(count_age_rating))
     logging.info("'count age rating' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the most common age rating
-def most_common_age_rating(df):
+def most_common_age_rating(df, report=None):
     logging.info("'most common age rating' started.")
-    most_common_age_rating = df["Age Rating"].mode().iloc[0]
-    print(f"The most common age rating is: {most_common_age_rating}")
+    age_rating_counts = get_value_counts(df, "Age Rating")
+    most_common_age_rating = most_common_value(age_rating_counts)
+    report_print(report, f"The most common age rating is: {most_common_age_rating}")
+    report_metric(report, "most common age rating", {'value': most_common_age_rating, 'games': age_rating_counts[most_common_age_rating]})
     logging.info("'most common age rating' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the least common age rating
-def least_common_age_rating(df):
+def least_common_age_rating(df, report=None):
     logging.info("'least common age rating' started.")
-    least_common_age_rating = min(df["Age Rating"].unique(), key=df["Age Rating"].tolist().count)
-    print(f"The least common age rating is: {least_common_age_rating}")
+    age_rating_counts = get_value_counts(df, "Age Rating")
+    least_common_age_rating = least_common_value(age_rating_counts)
+    report_print(report, f"The least common age rating is: {least_common_age_rating}")
+    report_metric(report, "least common age rating", {'value': least_common_age_rating, 'games': age_rating_counts[least_common_age_rating]})
     logging.info("'least common age rating' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # age rating bar chart
-def age_rating_bar_chart(df, file_name):
+def age_rating_bar_chart(df, file_name, fast=False):
     logging.info("'age rating bar chart' started.")
 
-    age_rating_count = df['Age Rating'].value_counts()
-
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    bar_colors = sns.color_palette("viridis", len(age_rating_count))
-    bars = ax.bar(age_rating_count.index, age_rating_count, color=bar_colors)
-
-    plt.setp(ax.xaxis.get_majorticklabels(), rotation=30, ha='right')
-
-    ax.set_title("Games by Age Rating", fontsize=16, color='white')
-    ax.set_xlabel("Age Rating", fontsize=12, color='white')
-    ax.set_ylabel("Games", fontsize=12, color='white')
-
-    ax.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax.tick_params(axis='x', colors='white')
-    ax.tick_params(axis='y', colors='white')
-
-    for bar in bars:
-        yval = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width() / 2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
+    age_rating_count = get_value_counts(df, 'Age Rating')
 
     png_file_name = f"{os.path.splitext(file_name)[0]}_age_rating.png"
-    plt.savefig(png_file_name, bbox_inches='tight', dpi=300)
+    with chart_figure(png_file_name, fast, figsize=(10, 6)) as (fig, ax):
+        bar_panel(ax, age_rating_count, "Games by Age Rating", "Age Rating")
+
     logging.info("'age rating bar chart' completed.")
 
 # # # # # # # # # # # #
@@ -604,63 +1937,217 @@ def age_rating_bar_chart(df, file_name):
 # # # # # # # # # # # #
 
 # counts all the games by platform
-def count_platform(df):
+def count_platform(df, report=None):
     logging.info("'count platform' started.")
-    count_platform = df["Platform"].value_counts()
-    count_platform.index.name = None
-    print("Games by platform:")
-    print(count_platform.to_string(name=False))
+    count_platform = get_value_counts(df, "Platform").rename_axis(None)
+    report_print(report, "Games by platform:")
+    report_print(report, count_platform.to_string(name=False))
+    report_metric(report, "games by platform", counts_metric(count_platform))
     logging.info("'count platform' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the most common platform
-def most_common_platform(df):
+def most_common_platform(df, report=None):
     logging.info("'most common platform' started.")
-    most_common_platform = df["Platform"].mode().iloc[0]
-    print(f"The most common platform is: {most_common_platform}")
+    platform_counts = get_value_counts(df, "Platform")
+    most_common_platform = most_common_value(platform_counts)
+    report_print(report, f"The most common platform is: {most_common_platform}")
+    report_metric(report, "most common platform", {'value': most_common_platform, 'games': platform_counts[most_common_platform]})
     logging.info("'most common platform' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # highlight the least common platform
-def least_common_platform(df):
+def least_common_platform(df, report=None):
     logging.info("'least common platform' started.")
-    least_common_platform = min(df["Platform"].unique(), key=df["Platform"].tolist().count)
-    print(f"The least common platform is: {least_common_platform}")
+    platform_counts = get_value_counts(df, "Platform")
+    least_common_platform = least_common_value(platform_counts)
+    report_print(report, f"The least common platform is: {least_common_platform}")
+    report_metric(report, "least common platform", {'value': least_common_platform, 'games': platform_counts[least_common_platform]})
     logging.info("'least common platform' completed.")
-    print("-" * 50)
-    print("-" * 50)
+    end_report_section(report)
 
 # platform bar chart
-def platform_bar_chart(df, file_name):
+def platform_bar_chart(df, file_name, fast=False):
     logging.info("'platform bar chart' started.")
 
-    platform_count = df['Platform'].value_counts()
+    platform_count = get_value_counts(df, 'Platform')
 
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(12, 6))
+    png_file_name = f"{os.path.splitext(file_name)[0]}_platform.png"
+    with chart_figure(png_file_name, fast, figsize=(12, 6)) as (fig, ax):
+        bar_panel(ax, platform_count, "Games by Platform", "Platform")
 
-    bar_colors = sns.color_palette("viridis", len(platform_count))
-    bars = ax.bar(platform_count.index, platform_count, color=bar_colors)
+    logging.info("'platform bar chart' completed.")
 
-    plt.setp(ax.xaxis.get_majorticklabels(), rotation=30, ha='right')
+# # # # # # # # # # # #
+#   CROSS ANALYSIS    #
+# # # # # # # # # # # #
 
-    ax.set_title("Games by Platform", fontsize=16, color='white')
-    ax.set_xlabel("Platform", fontsize=12, color='white')
-    ax.set_ylabel("Games", fontsize=12, color='white')
+# The cube holds the number of games of every combination of the dimensions below that occurs in
+# the data, one cell per combination, built with one groupby over the cleaned dataframe. Each
+# dimension is stored as small integer codes into its labels, so a slice is answered from the cells
+# alone: the codes of the sliced dimensions are combined into one key per cell and the games are
+# summed per key with np.bincount, without going back to the games themselves.
+
+# the dimensions of the cube
+CUBE_DIMENSIONS = ['Release Year', 'Release Month', 'Genre', 'Platform', 'Age Rating', 'Publisher']
+
+# the cross analysis printed in the report
+CROSS_ANALYSIS_TOP = 3
+
+# count the games of every combination of the cube dimensions, labels are kept in the order they
+# are first seen, like the frequency tables. With the platform facts a game is counted under every
+# platform it was released on, like the platform counts of the same report
+def build_cube(df, platform_facts=None):
+    logging.info("'build cube' started.")
+    if platform_facts is not None:
+        df = df[CUBE_DIMENSIONS].iloc[platform_facts['game']].reset_index(drop=True)
+        df['Platform'] = platform_facts['labels'][platform_facts['platform']]
+    cells = df.groupby(CUBE_DIMENSIONS, observed=True, sort=False).size()
+    cube = {'labels': {}, 'codes': {}, 'games': cells.to_numpy(dtype='int64'), 'every platform': platform_facts is not None}
+    for dimension in CUBE_DIMENSIONS:
+        codes, labels = pd.factorize(cells.index.get_level_values(dimension))
+        if isinstance(labels, pd.CategoricalIndex):
+            labels = labels.astype(labels.categories.dtype)
+        cube['labels'][dimension] = pd.Index(labels, name=dimension)
+        cube['codes'][dimension] = codes.astype(np.min_scalar_type(max(len(labels) - 1, 0)))
+    logging.info(f"'build cube' completed, {len(cells)} cells for {len(df)} games.")
+    return cube
+
+# the cells that match filters, a dict of a dimension and its value or list of values
+def cube_cells(cube, filters=None):
+    selected = np.ones(len(cube['games']), dtype=bool)
+    for dimension, values in (filters or {}).items():
+        wanted = cube['labels'][dimension].get_indexer(values if isinstance(values, list) else [values])
+        selected &= np.isin(cube['codes'][dimension], wanted[wanted >= 0])
+    return selected
+
+# the games by the given dimensions, most first, counted over the cells that match filters, the
+# total number of games when no dimension is given
+def cube_slice(cube, dimensions, filters=None):
+    dimensions = list(dimensions)
+    selected = cube_cells(cube, filters)
+    if not dimensions:
+        return int(cube['games'][selected].sum())
+    keys = np.zeros(selected.sum(), dtype='int64')
+    for dimension in dimensions:
+        keys = keys * len(cube['labels'][dimension]) + cube['codes'][dimension][selected]
+
+    key_codes, unique_keys = pd.factorize(keys)
+    games = np.bincount(key_codes, weights=cube['games'][selected], minlength=len(unique_keys)).astype('int64')
+
+    shape = [len(cube['labels'][dimension]) for dimension in dimensions]
+    index = pd.MultiIndex.from_arrays(
+        [cube['labels'][dimension][codes] for dimension, codes in zip(dimensions, np.unravel_index(unique_keys, shape))],
+        names=dimensions,
+    )
+    return pd.Series(games, index=index, name='Games').sort_values(ascending=False, kind='stable')
+
+# the n values of dimension with the most games for every combination of the by dimensions,
+# e.g. the top genres per platform per year
+def cube_top(cube, dimension, by, n=CROSS_ANALYSIS_TOP, filters=None):
+    games = cube_slice(cube, list(by) + [dimension], filters).reset_index()
+    games = games.sort_values(list(by), kind='stable')
+    return games.groupby(list(by), sort=False).head(n).set_index(list(by) + [dimension])['Games']
+
+# the share of the games of every combination of the by dimensions that each value of dimension
+# has, e.g. the publisher share by age rating
+def cube_share(cube, dimension, by, filters=None):
+    games = cube_slice(cube, list(by) + [dimension], filters).reset_index()
+    games = games.sort_values(list(by), kind='stable')
+    games['Share'] = games['Games'] / games.groupby(list(by), sort=False)['Games'].transform('sum')
+    return games.set_index(list(by) + [dimension])
+
+# print the top genres by platform and the top publishers' share by age rating
+def print_cross_analysis(cube, report=None):
+    logging.info("'print cross analysis' started.")
+    if cube.get('every platform'):
+        report_print(report, "The cross analysis counts a game released on several platforms once for every platform.")
+    top_genres = cube_top(cube, 'Genre', ['Platform'])
+    report_print(report, f"Top {CROSS_ANALYSIS_TOP} genres by platform:")
+    report_print(report, top_genres.to_string())
+    report_metric(report, "top genres by platform", top_genres.reset_index().to_dict('records'))
+    end_report_section(report)
+
+    publisher_share = cube_share(cube, 'Publisher', ['Age Rating'])
+    publisher_share = publisher_share.groupby(level='Age Rating', sort=False).head(CROSS_ANALYSIS_TOP)
+    report_print(report, f"Top {CROSS_ANALYSIS_TOP} publishers' share by age rating:")
+    report_print(report, publisher_share.to_string(formatters={'Share': '{:.1%}'.format}))
+    report_metric(report, "top publishers' share by age rating", publisher_share.reset_index().to_dict('records'))
+    logging.info("'print cross analysis' completed.")
+    end_report_section(report)
 
-    ax.grid(color='gray', linestyle='--', linewidth=0.5, alpha=0.3)
-    ax.tick_params(axis='x', colors='white')
-    ax.tick_params(axis='y', colors='white')
+# # # # # # # # # # # #
+#   CHARTS            #
+# # # # # # # # # # # #
 
-    for bar in bars:
-        yval = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width() / 2, yval, f"{yval:.0f}", ha='center', va='bottom', color='white', fontsize=8)
+# the charts and the frequency table each one reads, and whether it only shows its top and bottom 10
+CHARTS = [
+    (release_date_year_bar_chart, 'Release Period', False),
+    (release_date_month_line_chart, 'Release Period', False),
+    (developer_bar_chart, 'Developer', True),
+    (publisher_bar_chart, 'Publisher', True),
+    (genre_bar_chart, 'Genre', True),
+    (age_rating_bar_chart, 'Age Rating', False),
+    (platform_bar_chart, 'Platform', False),
+]
+
+# bar chart of the top 10 of a column counted by the sketches, which don't keep the least common values
+def approximate_bar_chart(df, file_name, fast=False):
+    (column, value_counts), = df.items()
+    logging.info(f"'approximate bar chart' {column} started.")
+
+    png_file_name = f"{os.path.splitext(file_name)[0]}_{column.lower().replace(' ', '_')}.png"
+    with chart_figure(png_file_name, fast) as (fig, ax):
+        bar_panel(ax, value_counts.head(10), f"Top 10 {column}s (approximate)", column)
+
+    logging.info(f"'approximate bar chart' {column} completed.")
+
+# the charts of the approximate mode, the sketched columns only show their top 10
+APPROXIMATE_CHARTS = [
+    (approximate_bar_chart, column, False) if column in SKETCH_COLUMNS else (chart, column, top_bottom)
+    for chart, column, top_bottom in CHARTS
+]
+
+# keeps only the top and bottom 10 rows of a frequency table
+def top_bottom_table(frequency_table, n=10):
+    if len(frequency_table) <= 2 * n:
+        return frequency_table
+    return pd.concat([frequency_table.head(n), frequency_table.tail(n)])
+
+# the small frequency tables each chart needs
+def chart_tables(frequency_tables, charts=CHARTS):
+    tables = []
+    for chart, column, top_bottom in charts:
+        frequency_table = get_value_counts(frequency_tables, column)
+        if top_bottom:
+            frequency_table = top_bottom_table(frequency_table)
+        tables.append((chart, {column: frequency_table}))
+    return tables
+
+# the charts whose numbers differ between the frequency tables and the previous ones
+def changed_charts(frequency_tables, previous_tables):
+    charts = []
+    for (chart, column, top_bottom), (_, chart_table), (_, previous_table) in zip(CHARTS, chart_tables(frequency_tables), chart_tables(previous_tables)):
+        if not chart_table[column].equals(previous_table[column]):
+            charts.append((chart, column, top_bottom))
+    return charts
+
+# render the charts, all of them by default, in a process pool of chart_workers processes when given
+# and with the fast chart settings when fast_charts is set
+def render_charts(frequency_tables, file_name, chart_workers=None, fast_charts=False, charts=CHARTS):
+    logging.info("'render charts' started.")
+    tables = chart_tables(frequency_tables, charts)
+
+    if chart_workers:
+        with ProcessPoolExecutor(max_workers=chart_workers) as executor:
+            futures = [executor.submit(chart, chart_table, file_name, fast_charts) for chart, chart_table in tables]
+            for future in futures:
+                future.result()
+    else:
+        for chart, chart_table in tables:
+            chart(chart_table, file_name, fast_charts)
 
-    png_file_name = f"{os.path.splitext(file_name)[0]}_platform.png"
-    plt.savefig(png_file_name, bbox_inches='tight', dpi=300)
-    logging.info("'platform bar chart' completed.")
+    logging.info("'render charts' completed.")
 
 # # # # # # # # # # # #
 #   END               #
@@ -1,130 +1,274 @@
 import video_games as vg
 
-import pandas as pd
 import sys
-from io import StringIO
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
 import logging
-import ast
-import re
 
-def run_video_games_access(file_name):
+def run_video_games_access(file_name, chunksize=None, chart_workers=None, fast_charts=False, use_cache=True, export_xlsx=False, profile_stages=False, output_directory=None, incremental=False, text_only=False, cross_analysis=False, near_duplicates=False, out_of_core=False, explode_platforms=False, approximate=False, clean_workers=None, columnar_store=False):
     try:
-        log_file_path = vg.get_file_path(f"{os.path.splitext(file_name)[0]}", "log")
-        txt_file_path = vg.get_file_path(f"{os.path.splitext(file_name)[0]}", "txt")
-        png_file_path_release_date_year = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_release_date_year", "png")
-        png_file_path_release_date_month = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_release_date_month", "png")
-        png_file_path_developer = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_developer", "png")
-        png_file_path_publisher = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_publisher", "png")
-        png_file_path_genre = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_genre", "png")
-        png_file_path_age_rating = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_age_rating", "png")
-        png_file_path_platform = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_platform", "png")
-        xlsx_file_path = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_cleaned", "xlsx")
-        csv_file_path = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_cleaned", "csv")
+        # the outputs go to the log, txt, ndjson, png, csv and xlsx directories of output_directory, next to this script by default
+        output_directory = output_directory or os.path.dirname(os.path.abspath(__file__))
+        report_name = os.path.splitext(os.path.basename(file_name))[0]
+        for directory in ["log", "txt", "ndjson", "png", "csv", "xlsx"]:
+            os.makedirs(os.path.join(output_directory, directory), exist_ok=True)
+
+        log_file_path = vg.get_file_path(report_name, "log", output_directory)
+        txt_file_path = vg.get_file_path(report_name, "txt", output_directory)
+        ndjson_file_path = vg.get_file_path(report_name, "ndjson", output_directory)
+        png_file_path_release_date_year = vg.get_file_path(f"{report_name}_release_date_year", "png", output_directory)
+        png_file_path_release_date_month = vg.get_file_path(f"{report_name}_release_date_month", "png", output_directory)
+        png_file_path_developer = vg.get_file_path(f"{report_name}_developer", "png", output_directory)
+        png_file_path_publisher = vg.get_file_path(f"{report_name}_publisher", "png", output_directory)
+        png_file_path_genre = vg.get_file_path(f"{report_name}_genre", "png", output_directory)
+        png_file_path_age_rating = vg.get_file_path(f"{report_name}_age_rating", "png", output_directory)
+        png_file_path_platform = vg.get_file_path(f"{report_name}_platform", "png", output_directory)
+        xlsx_file_path = vg.get_file_path(f"{report_name}_cleaned", "xlsx", output_directory)
+        csv_file_path = vg.get_file_path(f"{report_name}_cleaned", "csv", output_directory)
 
         vg.setup_logging(log_file_path)
         logging.info("'video games access' script started.")
 
-        vg.check_csv_file(file_name)
-        df, output_file, output_buffer = vg.start_process_csv_file(file_name)
-        vg.columns_validation(df)
-    
-        vg.print_info(df)
-        # vg.print_description(df)
-        # vg.print_first_row(df)
-
-        vg.rename_column(df)        
-        vg.clean_age_rating(df)
-        vg.extract_platform_info(df)
-        vg.check_missing_values(df)
-        vg.remove_duplicates(df)
-        vg.remove_columns(df)
-        # vg.remove_rows(df)
-        vg.reset_index(df)
-
-        cleaned_csv = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_cleaned", "csv")
-        df.to_csv(cleaned_csv, index=False)
-
-        cleaned_xlsx = vg.get_file_path(f"{os.path.splitext(file_name)[0]}_cleaned", "xlsx")
-        df.to_excel(cleaned_xlsx, index=False)
-
-        vg.total_games(df)
-
-        vg.count_release_date(df)
-        vg.most_common_release_date(df)
-        vg.least_common_release_date(df)
-        vg.release_date_year_bar_chart(df, file_name)
-        vg.release_date_month_line_chart(df, file_name)
-
-        vg.count_developer(df)
-        vg.most_common_developer(df)
-        vg.least_common_developer(df)
-        vg.developer_bar_chart(df, file_name)
-
-        vg.count_publisher(df)
-        vg.most_common_publisher(df)
-        vg.least_common_publisher(df)
-        vg.publisher_bar_chart(df, file_name)
-
-        vg.count_genre(df)
-        vg.most_common_genre(df)
-        vg.least_common_genre(df)
-        vg.genre_bar_chart(df, file_name)
-
-        vg.count_age_rating(df)
-        vg.most_common_age_rating(df)
-        vg.least_common_age_rating(df)
-        vg.age_rating_bar_chart(df, file_name)
-
-        vg.count_platform(df)
-        vg.most_common_platform(df)
-        vg.least_common_platform(df)
-        vg.platform_bar_chart(df, file_name)
+        # the report is written to disk section by section while the pipeline runs
+        report = vg.open_report(txt_file_path, ndjson_file_path)
+
+        profile_directory = os.path.join(output_directory, "log", f"{report_name}_profiles") if profile_stages else None
+        stage_metrics = vg.start_stage_metrics(profile_directory)
+
+        vg.run_stage(stage_metrics, vg.check_csv_file, file_name)
+
+        cache_file = vg.run_stage(stage_metrics, vg.get_cache_file, file_name, near_duplicates) if use_cache and not chunksize and not incremental and not out_of_core and not approximate else None
+        # the columnar store is kept next to the cache and shared by the runs on this host
+        store_directory = vg.get_columnar_store_directory(cache_file) if cache_file and columnar_store else None
+        charts = vg.CHARTS
+        xlsx_export = None
+        cube = None
+        platform_facts = None
+
+        # the near duplicates are found by comparing rows of the whole dataframe, which the streaming and incremental modes never hold
+        if near_duplicates and (chunksize or incremental or approximate) and not out_of_core:
+            logging.warning("The near duplicates need the whole dataframe, only the exact duplicates are removed in the streaming and incremental modes.")
+        # the platform facts are built from the whole cleaned dataframe, or read from the cache next to it
+        if explode_platforms and (chunksize or incremental or out_of_core or approximate):
+            logging.warning("The platform facts need the whole dataframe, the games are counted under their first platform in the streaming, incremental and out of core modes.")
+
+        if incremental:
+            # incremental mode: only the rows appended since the last run are cleaned and added to the saved counts
+            state_file = vg.get_file_path(f"{report_name}_state", "json", os.path.join(output_directory, "state"))
+            state = vg.run_stage(stage_metrics, vg.load_incremental_state, state_file)
+            previous_tables = vg.incremental_frequency_tables(state)
+
+            # the new rows go straight to the end of the cleaned csv in the csv directory
+            cleaned_csv = os.path.join(output_directory, "csv", os.path.basename(csv_file_path))
+            new_rows = vg.run_stage(stage_metrics, vg.append_new_rows, state, file_name, cleaned_csv, chunksize, report)
+            frequency_tables = vg.incremental_frequency_tables(state)
+            # a new state, or one saved by a text only run, draws all the charts
+            charts = vg.changed_charts(frequency_tables, previous_tables) if state['charts drawn'] else vg.CHARTS
+
+            if export_xlsx and (new_rows or not os.path.isfile(os.path.join(output_directory, "xlsx", os.path.basename(xlsx_file_path)))):
+                xlsx_export = vg.run_stage(stage_metrics, vg.start_xlsx_export, cleaned_csv, xlsx_file_path)
+        elif approximate:
+            # approximate mode: one pass over the chunks, the developers, publishers, genres and platforms are counted by sketches
+            frequency_tables = vg.run_stage(stage_metrics, vg.sketch_csv_file, file_name, chunksize, report)
+            charts = vg.APPROXIMATE_CHARTS
+        elif out_of_core:
+            # out of core mode: the csv file is cleaned in chunks spilled to disk, with the same report as in memory but for the memory usage
+            cleaned_csv = vg.get_file_path(f"{report_name}_cleaned", "csv", output_directory)
+            frequency_tables = vg.run_stage(stage_metrics, vg.clean_csv_out_of_core, file_name, cleaned_csv, near_duplicates, report, chunksize)
+
+            if export_xlsx:
+                xlsx_export = vg.run_stage(stage_metrics, vg.start_xlsx_export, cleaned_csv, xlsx_file_path)
+        elif chunksize:
+            # streaming mode: the chunks are cleaned one at a time and only their counts are kept
+            chunks = vg.run_stage(stage_metrics, vg.start_stream_csv_file, file_name, chunksize)
+
+            cleaned_csv = vg.get_file_path(f"{report_name}_cleaned", "csv", output_directory)
+            frequency_tables = vg.run_stage(stage_metrics, vg.clean_csv_chunks, chunks, cleaned_csv, report)
+
+            if export_xlsx:
+                xlsx_export = vg.run_stage(stage_metrics, vg.start_xlsx_export, cleaned_csv, xlsx_file_path)
+        elif store_directory and os.path.isdir(store_directory) and (not explode_platforms or os.path.isfile(vg.get_platform_facts_file(cache_file))):
+            # the same csv was already cleaned with the same settings, count it from the memory mapped columns
+            store = vg.run_stage(stage_metrics, vg.start_columnar_store, file_name, store_directory, report)
+
+            # the store is shared by every output directory, so every run copies the cleaned csv kept in it
+            cleaned_csv = vg.get_file_path(f"{report_name}_cleaned", "csv", output_directory)
+            vg.run_stage(stage_metrics, vg.copy_store_csv, store, cleaned_csv)
+
+            if export_xlsx:
+                xlsx_export = vg.run_stage(stage_metrics, vg.start_xlsx_export, cleaned_csv, xlsx_file_path)
+            if explode_platforms:
+                platform_facts = vg.run_stage(stage_metrics, vg.load_platform_facts, vg.get_platform_facts_file(cache_file))
+
+            frequency_tables = vg.run_stage(stage_metrics, vg.store_frequency_tables, store)
+            if cross_analysis:
+                # the cube dimensions are taken from the mapped codes, the same cube as from the cleaned dataframe
+                cube_dimensions = vg.run_stage(stage_metrics, vg.store_cube_dimensions, store)
+                cube = vg.run_stage(stage_metrics, vg.build_cube, cube_dimensions, platform_facts)
+        elif cache_file and os.path.isfile(cache_file) and (not explode_platforms or os.path.isfile(vg.get_platform_facts_file(cache_file))):
+            # the same csv was already cleaned with the same settings, go straight to the analysis
+            df = vg.run_stage(stage_metrics, vg.start_cached_csv_file, file_name, cache_file, report)
+            if explode_platforms:
+                platform_facts = vg.run_stage(stage_metrics, vg.load_platform_facts, vg.get_platform_facts_file(cache_file))
+
+            # the cache is shared by every output directory, so the cleaned csv is written again from it
+            cleaned_csv = vg.get_file_path(f"{report_name}_cleaned", "csv", output_directory)
+            vg.run_stage(stage_metrics, df.to_csv, cleaned_csv, index=False)
+
+            if export_xlsx:
+                xlsx_export = vg.run_stage(stage_metrics, vg.start_xlsx_export, cleaned_csv, xlsx_file_path)
+
+            vg.run_stage(stage_metrics, vg.normalize_release_date, df)
+            if store_directory and not os.path.isdir(store_directory):
+                # the feather cache was saved by a run without the columnar store
+                vg.run_stage(stage_metrics, vg.save_columnar_store, df, store_directory, vg.cached_cleaning_report(cache_file), cleaned_csv)
+            frequency_tables = vg.run_stage(stage_metrics, vg.build_frequency_tables, df)
+            if cross_analysis:
+                cube = vg.run_stage(stage_metrics, vg.build_cube, df, platform_facts)
+        else:
+            df = vg.run_stage(stage_metrics, vg.start_process_csv_file, file_name)
+            cleaning_report_start = vg.report_position(report)
+            vg.run_stage(stage_metrics, vg.columns_validation, df)
+        
+            vg.run_stage(stage_metrics, vg.print_info, df, report)
+            # vg.print_description(df)
+            # vg.print_first_row(df)
+
+            # every cleaning step is recorded as a stage of its own
+            df, platform_facts = vg.clean_games(df, near_duplicates, report, clean_workers, explode_platforms, stage_metrics)
+            # vg.remove_rows(df)
+
+            cleaned_csv = vg.get_file_path(f"{report_name}_cleaned", "csv", output_directory)
+            vg.run_stage(stage_metrics, df.to_csv, cleaned_csv, index=False)
+
+            if export_xlsx:
+                xlsx_export = vg.run_stage(stage_metrics, vg.start_xlsx_export, cleaned_csv, xlsx_file_path)
+
+            if cache_file:
+                cleaning_report = vg.read_report(report, cleaning_report_start)
+                vg.run_stage(stage_metrics, vg.save_cleaned_cache, df, cache_file, cleaning_report, platform_facts)
+
+            vg.run_stage(stage_metrics, vg.normalize_release_date, df)
+            if store_directory:
+                vg.run_stage(stage_metrics, vg.save_columnar_store, df, store_directory, cleaning_report, cleaned_csv)
+            frequency_tables = vg.run_stage(stage_metrics, vg.build_frequency_tables, df)
+            if cross_analysis:
+                cube = vg.run_stage(stage_metrics, vg.build_cube, df, platform_facts)
+
+        # the platforms are counted from the platform facts, every platform a game was released on
+        if platform_facts is not None:
+            frequency_tables['Platform'] = vg.run_stage(stage_metrics, vg.platform_frequency_table, platform_facts)
+
+        vg.run_stage(stage_metrics, vg.total_games, frequency_tables, report)
+
+        vg.run_stage(stage_metrics, vg.count_release_date, frequency_tables, report)
+        vg.run_stage(stage_metrics, vg.most_common_release_date, frequency_tables, report)
+        vg.run_stage(stage_metrics, vg.least_common_release_date, frequency_tables, report)
+
+        vg.run_stage(stage_metrics, vg.count_developer, frequency_tables, report)
+        vg.run_stage(stage_metrics, vg.most_common_developer, frequency_tables, report)
+        # the sketches of the approximate mode don't keep the least common values
+        if not approximate:
+            vg.run_stage(stage_metrics, vg.least_common_developer, frequency_tables, report)
+
+        vg.run_stage(stage_metrics, vg.count_publisher, frequency_tables, report)
+        vg.run_stage(stage_metrics, vg.most_common_publisher, frequency_tables, report)
+        if not approximate:
+            vg.run_stage(stage_metrics, vg.least_common_publisher, frequency_tables, report)
+
+        vg.run_stage(stage_metrics, vg.count_genre, frequency_tables, report)
+        vg.run_stage(stage_metrics, vg.most_common_genre, frequency_tables, report)
+        if not approximate:
+            vg.run_stage(stage_metrics, vg.least_common_genre, frequency_tables, report)
+
+        vg.run_stage(stage_metrics, vg.count_age_rating, frequency_tables, report)
+        vg.run_stage(stage_metrics, vg.most_common_age_rating, frequency_tables, report)
+        vg.run_stage(stage_metrics, vg.least_common_age_rating, frequency_tables, report)
+
+        vg.run_stage(stage_metrics, vg.count_platform, frequency_tables, report)
+        vg.run_stage(stage_metrics, vg.most_common_platform, frequency_tables, report)
+        if not approximate:
+            vg.run_stage(stage_metrics, vg.least_common_platform, frequency_tables, report)
+
+        # the cube is built from the whole cleaned dataframe, which only the in memory, cached and columnar store runs hold
+        if cube is not None:
+            vg.run_stage(stage_metrics, vg.print_cross_analysis, cube, report)
+        elif cross_analysis:
+            logging.warning("The cross analysis needs the whole cleaned dataframe, it is skipped in the streaming, incremental, out of core and approximate modes.")
+
+        # the text only mode never draws the charts, so it never imports the plotting stack
+        if not text_only:
+            vg.run_stage(stage_metrics, vg.render_charts, frequency_tables, os.path.join(output_directory, os.path.basename(file_name)), chart_workers, fast_charts, charts)
+
+        if xlsx_export:
+            vg.run_stage(stage_metrics, vg.finish_xlsx_export, xlsx_export, stage_metrics)
+
+        if incremental:
+            # saved last, so a run that stops early is done again from the same state
+            state['charts drawn'] = not text_only
+            vg.run_stage(stage_metrics, vg.save_incremental_state, state, state_file)
+
+        return frequency_tables
 
     except Exception as e:
         logging.error(f"An unexpected {type(e).__name__} error occurred: {e}")
         sys.exit(1)
 
     finally:
-        vg.end_process_csv_file(output_file, output_buffer)
+        vg.close_report(report)
+
+        stages_file_destination = os.path.join(output_directory, "log", f"{report_name}_stages.json")
+        vg.save_stage_metrics(stage_metrics, stages_file_destination)
 
         logging.info("'video games access' script completed.")
         logging.shutdown()
 
-        log_file_destination = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log", os.path.basename(log_file_path))
+        log_file_destination = os.path.join(output_directory, "log", os.path.basename(log_file_path))
         os.replace(log_file_path, log_file_destination)
 
-        txt_file_destination = os.path.join(os.path.dirname(os.path.abspath(__file__)), "txt", os.path.basename(txt_file_path))
+        txt_file_destination = os.path.join(output_directory, "txt", os.path.basename(txt_file_path))
         os.replace(txt_file_path, txt_file_destination)
 
-        png_file_destination_release_date_year = os.path.join(os.path.dirname(os.path.abspath(__file__)), "png", os.path.basename(png_file_path_release_date_year))
-        os.replace(png_file_path_release_date_year, png_file_destination_release_date_year)
+        ndjson_file_destination = os.path.join(output_directory, "ndjson", os.path.basename(ndjson_file_path))
+        os.replace(ndjson_file_path, ndjson_file_destination)
+
+        # incremental runs only render the charts whose numbers changed
+        if os.path.isfile(png_file_path_release_date_year):
+            png_file_destination_release_date_year = os.path.join(output_directory, "png", os.path.basename(png_file_path_release_date_year))
+            os.replace(png_file_path_release_date_year, png_file_destination_release_date_year)
 
-        png_file_destination_release_date_month = os.path.join(os.path.dirname(os.path.abspath(__file__)), "png", os.path.basename(png_file_path_release_date_month))
-        os.replace(png_file_path_release_date_month, png_file_destination_release_date_month)
+        if os.path.isfile(png_file_path_release_date_month):
+            png_file_destination_release_date_month = os.path.join(output_directory, "png", os.path.basename(png_file_path_release_date_month))
+            os.replace(png_file_path_release_date_month, png_file_destination_release_date_month)
 
-        png_file_destination_developer = os.path.join(os.path.dirname(os.path.abspath(__file__)), "png", os.path.basename(png_file_path_developer))
-        os.replace(png_file_path_developer, png_file_destination_developer)
+        if os.path.isfile(png_file_path_developer):
+            png_file_destination_developer = os.path.join(output_directory, "png", os.path.basename(png_file_path_developer))
+            os.replace(png_file_path_developer, png_file_destination_developer)
 
-        png_file_destination_publisher = os.path.join(os.path.dirname(os.path.abspath(__file__)), "png", os.path.basename(png_file_path_publisher))
-        os.replace(png_file_path_publisher, png_file_destination_publisher)
+        if os.path.isfile(png_file_path_publisher):
+            png_file_destination_publisher = os.path.join(output_directory, "png", os.path.basename(png_file_path_publisher))
+            os.replace(png_file_path_publisher, png_file_destination_publisher)
 
-        png_file_destination_genre = os.path.join(os.path.dirname(os.path.abspath(__file__)), "png", os.path.basename(png_file_path_genre))
-        os.replace(png_file_path_genre, png_file_destination_genre)
+        if os.path.isfile(png_file_path_genre):
+            png_file_destination_genre = os.path.join(output_directory, "png", os.path.basename(png_file_path_genre))
+            os.replace(png_file_path_genre, png_file_destination_genre)
 
-        png_file_destination_age_rating = os.path.join(os.path.dirname(os.path.abspath(__file__)), "png", os.path.basename(png_file_path_age_rating))
-        os.replace(png_file_path_age_rating, png_file_destination_age_rating)
+        if os.path.isfile(png_file_path_age_rating):
+            png_file_destination_age_rating = os.path.join(output_directory, "png", os.path.basename(png_file_path_age_rating))
+            os.replace(png_file_path_age_rating, png_file_destination_age_rating)
 
-        png_file_destination_platform = os.path.join(os.path.dirname(os.path.abspath(__file__)), "png", os.path.basename(png_file_path_platform))
-        os.replace(png_file_path_platform, png_file_destination_platform)
+        if os.path.isfile(png_file_path_platform):
+            png_file_destination_platform = os.path.join(output_directory, "png", os.path.basename(png_file_path_platform))
+            os.replace(png_file_path_platform, png_file_destination_platform)
 
-        xlsx_file_destination = os.path.join(os.path.dirname(os.path.abspath(__file__)), "xlsx", os.path.basename(xlsx_file_path))
-        os.replace(xlsx_file_path, xlsx_file_destination)
+        # the xlsx file is only written when asked for
+        if os.path.isfile(xlsx_file_path):
+            xlsx_file_destination = os.path.join(output_directory, "xlsx", os.path.basename(xlsx_file_path))
+            os.replace(xlsx_file_path, xlsx_file_destination)
 
-        csv_file_destination = os.path.join(os.path.dirname(os.path.abspath(__file__)), "csv", os.path.basename(csv_file_path))
-        os.replace(csv_file_path, csv_file_destination)
+        # the approximate mode doesn't write the cleaned csv
+        if os.path.isfile(csv_file_path):
+            csv_file_destination = os.path.join(output_directory, "csv", os.path.basename(csv_file_path))
+            os.replace(csv_file_path, csv_file_destination)
 
 if __name__ == "__main__":
     file_name = input("Enter the file name (including extension): ")
@@ -0,0 +1,107 @@
+import video_games as vg
+import video_games_access as vga
+
+import pandas as pd
+import sys
+import os
+import glob
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# # # # # # # # # # # #
+#   BATCH             #
+# # # # # # # # # # # #
+
+# the entities listed for every dimension in the summary
+TOP_ENTITIES = 10
+
+# the csv files of a directory, or the files matching a glob pattern
+def find_csv_files(source):
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "*.csv")))
+    return sorted(glob.glob(source))
+
+# give every csv file its own output directory, numbering the files that share a name
+def job_directories(csv_files, output_directory):
+    directories = []
+    seen_names = {}
+    for csv_file in csv_files:
+        name = os.path.splitext(os.path.basename(csv_file))[0]
+        seen_names[name] = seen_names.get(name, 0) + 1
+        if seen_names[name] > 1:
+            name = f"{name}_{seen_names[name]}"
+        directories.append(os.path.join(output_directory, name))
+    return directories
+
+# run one csv file in a worker process, a failed job returns None instead of stopping the batch
+def run_job(csv_file, job_directory, options):
+    try:
+        return vga.run_video_games_access(csv_file, output_directory=job_directory, **options)
+    except (Exception, SystemExit):
+        return None
+
+# add up the frequency tables of every job
+def merge_frequency_tables(job_frequency_tables):
+    merged_tables = {}
+    for column in vg.FREQUENCY_COLUMNS:
+        tables = [frequency_tables[column] for frequency_tables in job_frequency_tables]
+        merged_table = pd.concat(tables).groupby(level=0, sort=False).sum()
+        merged_tables[column] = merged_table.sort_values(ascending=False, kind='stable').rename_axis(column)
+    return merged_tables
+
+# the totals and top entities of the frequency tables
+def summarize_frequency_tables(frequency_tables):
+    return {
+        'total games': int(vg.get_value_counts(frequency_tables, 'Release Period').sum()),
+        'top entities': {
+            column: {str(value): int(count) for value, count in frequency_tables[column].head(TOP_ENTITIES).items()}
+            for column in vg.FREQUENCY_COLUMNS
+        },
+    }
+
+# process every csv file in a process pool and write the merged summary to the output directory
+def run_video_games_batch(source, output_directory, workers=None, **options):
+    csv_files = find_csv_files(source)
+    if not csv_files:
+        print(f"No csv files found for '{source}'.")
+        return None
+
+    os.makedirs(output_directory, exist_ok=True)
+    directories = job_directories(csv_files, output_directory)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_job, csv_file, job_directory, options) for csv_file, job_directory in zip(csv_files, directories)]
+        results = [future.result() for future in futures]
+
+    jobs = {}
+    job_frequency_tables = []
+    for csv_file, job_directory, frequency_tables in zip(csv_files, directories, results):
+        if frequency_tables is None:
+            jobs[csv_file] = {'output directory': job_directory, 'failed': True}
+            print(f"{csv_file} failed, see the log in {job_directory}.")
+            continue
+        jobs[csv_file] = {'output directory': job_directory, **summarize_frequency_tables(frequency_tables)}
+        job_frequency_tables.append(frequency_tables)
+
+    summary = {'jobs': jobs}
+    if job_frequency_tables:
+        summary.update(summarize_frequency_tables(merge_frequency_tables(job_frequency_tables)))
+
+    summary_file = os.path.join(output_directory, "batch_summary.json")
+    with open(summary_file, "w") as summary_json:
+        json.dump(summary, summary_json, indent=4)
+    print(f"Processed {len(job_frequency_tables)} of {len(csv_files)} csv files, the summary is in {summary_file}.")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process many video games csv files at once.")
+    parser.add_argument('source', help="a directory of csv files or a glob pattern, e.g. 'exports/*.csv'")
+    parser.add_argument('output_directory', help="where every csv file gets its own output directory")
+    parser.add_argument('--workers', type=int, default=None, help="processes to run at once, the number of cpus by default")
+    parser.add_argument('--export-xlsx', action='store_true', help="also write the cleaned xlsx files")
+    parser.add_argument('--fast-charts', action='store_true', help="render the charts with the fast settings")
+    parser.add_argument('--text-only', action='store_true', help="write the reports and cleaned csv files without charts")
+    args = parser.parse_args()
+    summary = run_video_games_batch(args.source, args.output_directory, args.workers, export_xlsx=args.export_xlsx, fast_charts=args.fast_charts, text_only=args.text_only)
+    sys.exit(0 if summary and not any(job.get('failed') for job in summary['jobs'].values()) else 1)
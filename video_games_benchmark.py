@@ -0,0 +1,274 @@
+import video_games as vg
+
+import pandas as pd
+import numpy as np
+import sys
+import os
+import json
+import argparse
+import logging
+import subprocess
+import statistics
+import time
+from contextlib import redirect_stdout
+
+# # # # # # # # # # # #
+#   SETTINGS          #
+# # # # # # # # # # # #
+
+BENCHMARK_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark")
+DATA_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, "data")
+BASELINES_FILE = os.path.join(BENCHMARK_DIRECTORY, "baselines.json")
+HISTORY_FILE = os.path.join(BENCHMARK_DIRECTORY, "history.jsonl")
+
+# the dataset sizes of the suite
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# excel can't hold more rows than this, bigger datasets skip the xlsx export
+XLSX_MAX_ROWS = 1_048_575
+
+# a stage is a regression when it is this much slower than its baseline, and by at least the minimum seconds
+REGRESSION_TOLERANCE = 0.2
+REGRESSION_MINIMUM_SECONDS = 0.05
+
+# rows generated at a time
+GENERATOR_CHUNKSIZE = 100_000
+
+# the python startups timed by the startup benchmark, the text only one fails if it loads matplotlib
+STARTUP_COMMANDS = {
+    'text only': "import sys, video_games_access; sys.exit('matplotlib' in sys.modules)",
+    'charts': "import video_games_access, video_games; video_games.load_plotting()",
+}
+STARTUP_REPEATS = 10
+
+# # # # # # # # # # # #
+#   GENERATOR         #
+# # # # # # # # # # # #
+
+PLATFORMS = ['PC', 'PlayStation 4', 'Xbox One', 'Switch', 'PlayStation 3', 'Xbox 360', 'Wii', 'PlayStation 2', 'DS', '3DS', 'PlayStation Vita', 'Wii U', 'Xbox', 'GameCube', 'PSP', 'iOS', 'PlayStation 5', 'Xbox Series X']
+GENRES = ['Action', 'Action Adventure', 'Role-Playing', 'Western RPG', 'Japanese RPG', 'Shooter', 'Sports', 'Racing', 'Strategy', 'Puzzle', 'Rhythm', 'Platformer', 'Simulation', 'Fighting', 'Adventure']
+PRODUCT_RATINGS = list(vg.AGE_RATING_MAPPING.keys())
+PRODUCT_RATING_WEIGHTS = [0.33, 0.3, 0.2, 0.15, 0.015, 0.005]
+
+# the share of missing values of each column, close to the kaggle dataset
+NULL_RATES = {
+    'Title': 0.0015,
+    'Release Date': 0.005,
+    'Developer': 0.01,
+    'Publisher': 0.01,
+    'Genres': 0.0015,
+    'Product Rating': 0.22,
+    'User Score': 0.17,
+    'User Ratings Count': 0.2,
+}
+
+# the share of rows that repeat an earlier row
+DUPLICATE_RATE = 0.02
+
+# one "Platforms Info" cell, written the way the kaggle dataset writes the python list of dicts
+def platforms_info_cell(platforms, metascores, critic_counts):
+    entries = [
+        f"{{'Platform': '{platform}', 'Platform Metascore': '{metascore}', 'Platform Metascore Count': 'Based on {critic_count} Critic Reviews'}}"
+        for platform, metascore, critic_count in zip(platforms, metascores, critic_counts)
+    ]
+    return f"[{', '.join(entries)}]"
+
+# generate one chunk of rows, row_offset keeps the titles unique across chunks
+def generate_chunk(rng, rows, row_offset, developers, publishers):
+    titles = np.char.add("Game ", (np.arange(rows) + row_offset).astype(str))
+    years = rng.integers(1995, 2024, rows)
+    months = rng.integers(1, 13, rows)
+    days = rng.integers(1, 29, rows)
+    release_dates = [f"{month}/{day}/{year}" for month, day, year in zip(months, days, years)]
+
+    # zipf-like popularity, a few developers and publishers make most of the games
+    developer_index = np.minimum(rng.zipf(1.3, rows) - 1, len(developers) - 1)
+    publisher_index = np.minimum(rng.zipf(1.3, rows) - 1, len(publishers) - 1)
+
+    platform_counts = rng.choice([0, 1, 2, 3, 4], rows, p=[0.002, 0.6, 0.2, 0.12, 0.078])
+    platforms_info = []
+    for platform_count in platform_counts:
+        platforms = rng.choice(PLATFORMS, platform_count, replace=False)
+        metascores = [str(score) if score >= 20 else 'tbd' for score in rng.integers(10, 100, platform_count)]
+        platforms_info.append(platforms_info_cell(platforms, metascores, rng.integers(1, 120, platform_count)))
+
+    chunk = pd.DataFrame({
+        'Title': titles,
+        'Release Date': release_dates,
+        'Developer': np.asarray(developers, dtype=object)[developer_index],
+        'Publisher': np.asarray(publishers, dtype=object)[publisher_index],
+        'Genres': rng.choice(GENRES, rows),
+        'Product Rating': rng.choice(PRODUCT_RATINGS, rows, p=PRODUCT_RATING_WEIGHTS),
+        'User Score': np.round(rng.uniform(0, 10, rows), 1),
+        'User Ratings Count': rng.integers(1, 5000, rows).astype('float64'),
+        'Platforms Info': platforms_info,
+    })
+
+    for column, null_rate in NULL_RATES.items():
+        chunk.loc[rng.random(rows) < null_rate, column] = np.nan
+
+    duplicates = chunk.sample(frac=DUPLICATE_RATE, random_state=int(rng.integers(2 ** 31)))
+    return pd.concat([chunk, duplicates]).sample(frac=1, random_state=int(rng.integers(2 ** 31)))
+
+# write a synthetic csv with the columns checked by columns_validation
+def generate_video_games_csv(file_name, rows, seed=0):
+    logging.info(f"'generate video games csv' {file_name} with {rows} rows started.")
+    rng = np.random.default_rng(seed)
+    developers = [f"Developer {index}" for index in range(max(rows // 20, 10))]
+    publishers = [f"Publisher {index}" for index in range(max(rows // 50, 10))]
+
+    header = True
+    for row_offset in range(0, rows, GENERATOR_CHUNKSIZE):
+        chunk_rows = min(GENERATOR_CHUNKSIZE, rows - row_offset)
+        chunk = generate_chunk(rng, chunk_rows, row_offset, developers, publishers)
+        chunk.to_csv(file_name, mode='w' if header else 'a', header=header, index=False)
+        header = False
+
+    logging.info("'generate video games csv' completed.")
+
+# # # # # # # # # # # #
+#   BENCHMARK         #
+# # # # # # # # # # # #
+
+# run the pipeline stage by stage on a generated csv and return the stage metrics
+def run_benchmark(size, seed=0):
+    os.makedirs(DATA_DIRECTORY, exist_ok=True)
+    file_name = os.path.join(DATA_DIRECTORY, f"video_games_{size}.csv")
+    if not os.path.isfile(file_name):
+        generate_video_games_csv(file_name, SIZES[size], seed)
+
+    cleaned_csv = os.path.join(DATA_DIRECTORY, f"video_games_{size}_cleaned.csv")
+    cleaned_xlsx = os.path.join(DATA_DIRECTORY, f"video_games_{size}_cleaned.xlsx")
+    stage_metrics = vg.start_stage_metrics()
+
+    # the report isn't kept, but printing it is part of the work being timed
+    with open(os.devnull, "w") as report, redirect_stdout(report):
+        df = vg.run_stage(stage_metrics, pd.read_csv, file_name)
+
+        df, _ = vg.clean_games(df, stage_metrics=stage_metrics)
+
+        vg.run_stage(stage_metrics, df.to_csv, cleaned_csv, index=False)
+        if len(df) <= XLSX_MAX_ROWS:
+            vg.run_stage(stage_metrics, vg.export_xlsx, cleaned_csv, cleaned_xlsx)
+
+        vg.run_stage(stage_metrics, vg.normalize_release_date, df)
+        frequency_tables = vg.run_stage(stage_metrics, vg.build_frequency_tables, df)
+
+        for analysis in [vg.total_games, vg.count_release_date, vg.most_common_release_date, vg.least_common_release_date,
+                         vg.count_developer, vg.most_common_developer, vg.least_common_developer,
+                         vg.count_publisher, vg.most_common_publisher, vg.least_common_publisher,
+                         vg.count_genre, vg.most_common_genre, vg.least_common_genre,
+                         vg.count_age_rating, vg.most_common_age_rating, vg.least_common_age_rating,
+                         vg.count_platform, vg.most_common_platform, vg.least_common_platform]:
+            vg.run_stage(stage_metrics, analysis, frequency_tables)
+
+        for chart, chart_table in vg.chart_tables(frequency_tables):
+            vg.run_stage(stage_metrics, chart, chart_table, file_name)
+
+    return stage_metrics['stages']
+
+# time starting python and importing the pipeline, without and with the plotting stack, returns the
+# median seconds of each
+def run_startup_benchmark(repeats=STARTUP_REPEATS):
+    startup_times = {}
+    for name, command in STARTUP_COMMANDS.items():
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', command], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            times.append(time.perf_counter() - start)
+        startup_times[name] = statistics.median(times)
+        print(f"{name:<16}{startup_times[name]:>10.3f} s")
+    print(f"The text only startup saves {startup_times['charts'] - startup_times['text only']:.3f} s, median of {repeats} runs.")
+    return startup_times
+
+# # # # # # # # # # # #
+#   BASELINES         #
+# # # # # # # # # # # #
+
+# the commit being benchmarked, None outside of a git checkout
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# read the stored baselines, per dataset size
+def load_baselines():
+    if not os.path.isfile(BASELINES_FILE):
+        return {}
+    with open(BASELINES_FILE) as baselines_file:
+        return json.load(baselines_file)
+
+# store the stage wall times of a run as the new baseline of its size
+def save_baseline(size, stages, commit):
+    baselines = load_baselines()
+    baselines[size] = {'commit': commit, 'stages': {stage['stage']: stage['wall time'] for stage in stages}}
+    with open(BASELINES_FILE, "w") as baselines_file:
+        json.dump(baselines, baselines_file, indent=4)
+
+# append a run to the history, so timings can be followed across commits
+def save_history(size, stages, commit):
+    with open(HISTORY_FILE, "a") as history_file:
+        history_file.write(json.dumps({'size': size, 'commit': commit, 'stages': stages}) + "\n")
+
+# print the wall time of every stage of a run, next to the baseline of its size when there is one, and
+# return the stages that got slower
+def find_regressions(size, stages):
+    baseline = load_baselines().get(size)
+    baseline_stages = baseline['stages'] if baseline else {}
+
+    regressions = []
+    print(f"{'stage':<32}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for stage in stages:
+        baseline_time = baseline_stages.get(stage['stage'])
+        if baseline_time is None:
+            print(f"{stage['stage']:<32}{'-':>12}{stage['wall time']:>12.4f}{'-':>8}")
+            continue
+        ratio = stage['wall time'] / baseline_time if baseline_time else float('inf')
+        regression = stage['wall time'] > baseline_time * (1 + REGRESSION_TOLERANCE) and stage['wall time'] - baseline_time > REGRESSION_MINIMUM_SECONDS
+        print(f"{stage['stage']:<32}{baseline_time:>12.4f}{stage['wall time']:>12.4f}{ratio:>8.2f}{'  REGRESSION' if regression else ''}")
+        if regression:
+            regressions.append(stage['stage'])
+    if baseline is None:
+        print(f"No baseline for {size} yet, run with --update-baseline to store one.")
+    else:
+        print(f"Compared against the baseline of commit {baseline['commit']}.")
+    return regressions
+
+# # # # # # # # # # # #
+#   MAIN              #
+# # # # # # # # # # # #
+
+def run_video_games_benchmark(sizes, update_baseline=False, seed=0):
+    commit = current_commit()
+    regressions = []
+    for size in sizes:
+        print(f"Benchmarking {size} rows...")
+        stages = run_benchmark(size, seed)
+        save_history(size, stages, commit)
+        regressions += [f"{size}: {stage}" for stage in find_regressions(size, stages)]
+        if update_baseline:
+            save_baseline(size, stages, commit)
+            print(f"Stored the {size} baseline.")
+        print("-" * 50)
+
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the video games pipeline on synthetic datasets.")
+    parser.add_argument('sizes', nargs='*', help=f"dataset sizes to run, from {', '.join(SIZES)}, 10k by default")
+    parser.add_argument('--update-baseline', action='store_true', help="store this run as the baseline of its sizes")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the generated datasets")
+    parser.add_argument('--startup', action='store_true', help="time the python startup with and without the plotting stack instead")
+    args = parser.parse_args()
+    for size in args.sizes:
+        if size not in SIZES:
+            parser.error(f"unknown size '{size}', choose from {', '.join(SIZES)}")
+    if args.startup:
+        run_startup_benchmark()
+        sys.exit(0)
+    sys.exit(1 if run_video_games_benchmark(args.sizes or ['10k'], args.update_baseline, args.seed) else 0)
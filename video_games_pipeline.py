@@ -0,0 +1,322 @@
+import video_games as vg
+
+import os
+import io
+import sys
+import json
+import pickle
+import hashlib
+import argparse
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# # # # # # # # # # # #
+#   STAGES            #
+# # # # # # # # # # # #
+
+# The pipeline is a dict of stages, each named after the value it returns and declaring the values
+# it reads. The csv file is the only value no stage returns. Asking for outputs runs only the
+# stages they depend on, the stages whose inputs are ready run at the same time, the charts in
+# worker processes because matplotlib can't draw from several threads, and the memoized stages
+# keep their result on disk under a key made of their inputs' keys. The key of the csv file is
+# the hash of its content and of the cleaning settings, so a result is reused until the csv file
+# or the stages that lead to it change, and a stage found on disk doesn't need its inputs at all.
+# The report stages write their section to a report kept in memory and return it, the sections
+# asked for are then written to the txt and ndjson files in the order of the stages.
+
+# bump when a stage changes what it returns, it is part of every memo key
+MEMO_VERSION = 1
+
+# a report kept in memory
+def memory_report():
+    return {'txt': io.StringIO(), 'ndjson': io.StringIO()}
+
+# the text and metrics written to a report kept in memory
+def section_text(report):
+    return report['txt'].getvalue(), report['ndjson'].getvalue()
+
+# the info section of the raw games
+def info_section(raw_games):
+    report = memory_report()
+    vg.columns_validation(raw_games)
+    vg.print_info(raw_games, report)
+    return section_text(report)
+
+# clean a copy of the raw games, returning them with the missing values and duplicates sections
+def clean_games(raw_games):
+    report = memory_report()
+    df, _ = vg.clean_games(raw_games.copy(), report=report)
+    return {'games': df, 'section': section_text(report)}
+
+# the missing values and duplicates sections written while cleaning
+def cleaning_section(cleaned_games):
+    return cleaned_games['section']
+
+# the cleaned games with their release year, month and period, leaving the cleaned games as they are
+def dated_games(cleaned_games):
+    df = cleaned_games['games'].copy(deep=False)
+    vg.normalize_release_date(df)
+    return df
+
+# write the cleaned games to the cleaned csv
+def write_cleaned_csv(cleaned_games, cleaned_csv):
+    cleaned_games['games'].to_csv(cleaned_csv, index=False)
+    return cleaned_csv
+
+# a stage running an analysis function of video_games.py, returning the section it wrote
+def analysis_section(function, value):
+    report = memory_report()
+    function(value, report)
+    return section_text(report)
+
+# draw one chart and return the png, runs in a worker process
+def draw_chart(chart, column, top_bottom, fast_charts, frequency_tables):
+    (_, chart_table), = vg.chart_tables(frequency_tables, [(chart, column, top_bottom)])
+    return vg.render_chart_png(chart, chart_table, fast_charts)
+
+# the analysis functions, in the order of their sections in the report
+ANALYSIS_FUNCTIONS = [
+    vg.total_games,
+    vg.count_release_date, vg.most_common_release_date, vg.least_common_release_date,
+    vg.count_developer, vg.most_common_developer, vg.least_common_developer,
+    vg.count_publisher, vg.most_common_publisher, vg.least_common_publisher,
+    vg.count_genre, vg.most_common_genre, vg.least_common_genre,
+    vg.count_age_rating, vg.most_common_age_rating, vg.least_common_age_rating,
+    vg.count_platform, vg.most_common_platform, vg.least_common_platform,
+]
+
+# the name of the stage of an analysis function, e.g. count platform
+def analysis_stage_name(function):
+    return function.__name__.replace('_', ' ')
+
+# the name of the stage of a chart, e.g. platform chart, and the end of its png file name, e.g. platform
+def chart_suffix(chart):
+    return chart.__name__.rsplit('_', 2)[0]
+
+def chart_stage_name(chart):
+    return f"{chart_suffix(chart).replace('_', ' ')} chart"
+
+# every stage: the function, the values it reads, whether its result is kept on disk, whether it runs
+# in a worker process and whether it is a report section or a chart
+def pipeline_stages(cleaned_csv=None, fast_charts=False):
+    stages = {
+        'raw games': {'function': vg.start_process_csv_file, 'inputs': ['csv file']},
+        'info section': {'function': info_section, 'inputs': ['raw games'], 'memoize': True, 'section': True},
+        'cleaned games': {'function': clean_games, 'inputs': ['raw games'], 'memoize': True},
+        'cleaning section': {'function': cleaning_section, 'inputs': ['cleaned games'], 'section': True},
+        'cleaned csv': {'function': partial(write_cleaned_csv, cleaned_csv=cleaned_csv), 'inputs': ['cleaned games']},
+        'dated games': {'function': dated_games, 'inputs': ['cleaned games']},
+        'frequency tables': {'function': vg.build_frequency_tables, 'inputs': ['dated games'], 'memoize': True},
+        'cube': {'function': vg.build_cube, 'inputs': ['dated games'], 'memoize': True},
+    }
+    for function in ANALYSIS_FUNCTIONS:
+        stages[analysis_stage_name(function)] = {'function': partial(analysis_section, function), 'inputs': ['frequency tables'], 'memoize': True, 'section': True}
+    stages['print cross analysis'] = {'function': partial(analysis_section, vg.print_cross_analysis), 'inputs': ['cube'], 'memoize': True, 'section': True}
+    for chart, column, top_bottom in vg.CHARTS:
+        stages[chart_stage_name(chart)] = {
+            'function': partial(draw_chart, chart, column, top_bottom, fast_charts),
+            'inputs': ['frequency tables'],
+            'memoize': True,
+            'process': True,
+            'chart': chart,
+            # the fast charts are different pngs
+            'options': {'fast charts': fast_charts},
+        }
+    return stages
+
+# the outputs that can be asked for besides the name of any stage, and the stages they stand for
+OUTPUTS = {
+    'report': ['info section', 'cleaning section'] + [analysis_stage_name(function) for function in ANALYSIS_FUNCTIONS],
+    'counts': ['total games'] + [analysis_stage_name(function) for function in ANALYSIS_FUNCTIONS if function.__name__.startswith('count_')],
+    'charts': [chart_stage_name(chart) for chart, _, _ in vg.CHARTS],
+    'cross analysis': ['print cross analysis'],
+}
+
+# # # # # # # # # # # #
+#   RUNNER            #
+# # # # # # # # # # # #
+
+# the stages an output stands for, only the stages writing a report section, a chart or the cleaned csv are outputs
+def output_stages(stages, outputs):
+    output_names = list(OUTPUTS) + [name for name, stage in stages.items() if stage.get('section') or stage.get('chart') or name == 'cleaned csv']
+    targets = []
+    for output in outputs:
+        names = OUTPUTS.get(output, [output])
+        for name in names:
+            if output not in output_names:
+                raise ValueError(f"no such output '{output}', choose from {', '.join(output_names)}")
+            if name not in targets:
+                targets.append(name)
+    return targets
+
+# the memo key of every stage, made of its name, its options and the keys of its inputs
+def memo_keys(stages, file_name):
+    keys = {'csv file': vg.cache_key(file_name)}
+
+    def memo_key(name):
+        if name not in keys:
+            stage = stages[name]
+            key_parts = [MEMO_VERSION, name, stage.get('options', {}), [memo_key(value) for value in stage['inputs']]]
+            keys[name] = hashlib.sha256(json.dumps(key_parts, sort_keys=True).encode()).hexdigest()[:16]
+        return keys[name]
+
+    for name in stages:
+        memo_key(name)
+    return keys
+
+# the file a stage result is kept in
+def memo_file(memo_directory, name, key):
+    return os.path.join(memo_directory, f"{name.replace(' ', '_')}_{key}.pickle")
+
+# whether the result of a stage is on disk
+def memoized(stages, name, keys, memo_directory):
+    return bool(memo_directory) and stages[name].get('memoize', False) and os.path.isfile(memo_file(memo_directory, name, keys[name]))
+
+# keep the result of a stage on disk, written to a temporary file and renamed into place
+def save_memo(memo_directory, name, key, value):
+    os.makedirs(memo_directory, exist_ok=True)
+    file_path = memo_file(memo_directory, name, key)
+    with open(f"{file_path}.{os.getpid()}.tmp", "wb") as memo:
+        pickle.dump(value, memo, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{file_path}.{os.getpid()}.tmp", file_path)
+
+# read the result of a stage kept on disk
+def load_memo(memo_directory, name, key):
+    with open(memo_file(memo_directory, name, key), "rb") as memo:
+        return pickle.load(memo)
+
+# the stages the targets need, in the order they are declared, a memoized stage doesn't need its inputs
+def required_stages(stages, targets, keys, memo_directory):
+    required = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name in required or name not in stages:
+            continue
+        required.add(name)
+        if not memoized(stages, name, keys, memo_directory):
+            pending.extend(stages[name]['inputs'])
+    return [name for name in stages if name in required]
+
+# run the stages the targets need, each as soon as its inputs are ready, and return the targets' values,
+# raises ValueError when the stages left wait for values no stage will give
+def run_pipeline(stages, targets, file_name, workers=None, memo_directory=None):
+    logging.info(f"'run pipeline' {', '.join(targets)} started.")
+    keys = memo_keys(stages, file_name)
+    required = required_stages(stages, targets, keys, memo_directory)
+
+    # a value is dropped once every stage reading it is done, unless it was asked for
+    readers = {}
+    for name in required:
+        if not memoized(stages, name, keys, memo_directory):
+            for value in stages[name]['inputs']:
+                readers[value] = readers.get(value, 0) + 1
+
+    values = {'csv file': file_name}
+    waiting = list(required)
+    running = {}
+    threads = ThreadPoolExecutor(max_workers=workers)
+    processes = ProcessPoolExecutor(max_workers=workers) if any(stages[name].get('process') for name in required) else None
+    try:
+        while waiting or running:
+            started = False
+            for name in list(waiting):
+                stage = stages[name]
+                if memoized(stages, name, keys, memo_directory):
+                    values[name] = load_memo(memo_directory, name, keys[name])
+                    waiting.remove(name)
+                    started = True
+                    logging.info(f"'run pipeline' {name} read from the memo.")
+                elif all(value in values for value in stage['inputs']):
+                    executor = processes if stage.get('process') else threads
+                    running[executor.submit(stage['function'], *[values[value] for value in stage['inputs']])] = name
+                    waiting.remove(name)
+                    started = True
+                    logging.info(f"'run pipeline' {name} started.")
+
+            if not running:
+                # nothing runs and nothing could start, e.g. a memo was removed after the required stages
+                # were found without the stages giving its inputs
+                if waiting and not started:
+                    stuck = '; '.join(f"'{name}' waits for {', '.join(repr(value) for value in stages[name]['inputs'] if value not in values)}" for name in waiting)
+                    raise ValueError(f"the pipeline is stuck, no stage gives the inputs of {stuck}")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                values[name] = future.result()
+                logging.info(f"'run pipeline' {name} completed.")
+                if memo_directory and stages[name].get('memoize'):
+                    save_memo(memo_directory, name, keys[name], values[name])
+                for value in stages[name]['inputs']:
+                    readers[value] -= 1
+                    if not readers[value] and value not in targets:
+                        values.pop(value, None)
+    finally:
+        threads.shutdown(cancel_futures=True)
+        if processes:
+            processes.shutdown(cancel_futures=True)
+
+    logging.info("'run pipeline' completed.")
+    return {name: values[name] for name in targets}
+
+# run the stages the outputs need and write only the outputs produced: the report sections asked for,
+# in the order of the stages, the charts and the cleaned csv
+def run_video_games_pipeline(file_name, outputs=('report', 'charts'), output_directory=None, workers=None, use_memo=True, fast_charts=False):
+    output_directory = output_directory or os.path.dirname(os.path.abspath(__file__))
+    report_name = os.path.splitext(os.path.basename(file_name))[0]
+    os.makedirs(os.path.join(output_directory, "log"), exist_ok=True)
+    vg.setup_logging(vg.get_file_path(f"{report_name}_pipeline", "log", os.path.join(output_directory, "log")))
+    logging.info("'video games pipeline' script started.")
+    vg.check_csv_file(file_name)
+
+    cleaned_csv = vg.get_file_path(f"{report_name}_cleaned", "csv", os.path.join(output_directory, "csv"))
+    stages = pipeline_stages(cleaned_csv, fast_charts)
+    targets = output_stages(stages, outputs)
+    memo_directory = os.path.join(vg.CACHE_DIRECTORY, "pipeline") if use_memo else None
+
+    if 'cleaned csv' in targets:
+        os.makedirs(os.path.dirname(cleaned_csv), exist_ok=True)
+    results = run_pipeline(stages, targets, file_name, workers, memo_directory)
+
+    written = []
+    sections = [name for name in stages if name in results and stages[name].get('section')]
+    if sections:
+        for directory in ["txt", "ndjson"]:
+            os.makedirs(os.path.join(output_directory, directory), exist_ok=True)
+        report = vg.open_report(vg.get_file_path(report_name, "txt", os.path.join(output_directory, "txt")), vg.get_file_path(report_name, "ndjson", os.path.join(output_directory, "ndjson")))
+        for name in sections:
+            vg.write_report(report, *results[name])
+        vg.close_report(report)
+        written += [vg.get_file_path(report_name, "txt", os.path.join(output_directory, "txt")), vg.get_file_path(report_name, "ndjson", os.path.join(output_directory, "ndjson"))]
+
+    for name in [name for name in stages if name in results and stages[name].get('chart')]:
+        os.makedirs(os.path.join(output_directory, "png"), exist_ok=True)
+        png_file_path = vg.get_file_path(f"{report_name}_{chart_suffix(stages[name]['chart'])}", "png", os.path.join(output_directory, "png"))
+        with open(png_file_path, "wb") as png_file:
+            png_file.write(results[name])
+        written.append(png_file_path)
+
+    if 'cleaned csv' in results:
+        written.append(results['cleaned csv'])
+
+    logging.info("'video games pipeline' script completed.")
+    logging.shutdown()
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write only the video games outputs asked for, running the stages they need.")
+    parser.add_argument('file_name', help="the video games csv file")
+    parser.add_argument('--output', action='append', help=f"an output, can be given more than once: {', '.join(OUTPUTS)}, 'cleaned csv' or the name of any stage, e.g. 'platform chart', the report and the charts by default")
+    parser.add_argument('--output-directory', default=None, help="where the log, txt, ndjson, png and csv directories go, next to this script by default")
+    parser.add_argument('--workers', type=int, default=None, help="stages to run at once")
+    parser.add_argument('--no-memo', action='store_true', help="run every stage again instead of reading the results kept on disk")
+    parser.add_argument('--fast-charts', action='store_true', help="draw the charts with the fast settings")
+    args = parser.parse_args()
+    try:
+        written = run_video_games_pipeline(args.file_name, args.output or ['report', 'charts'], args.output_directory, args.workers, not args.no_memo, args.fast_charts)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    print("\n".join(written))
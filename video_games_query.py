@@ -0,0 +1,156 @@
+import video_games as vg
+
+import pandas as pd
+import numpy as np
+import sys
+import argparse
+import logging
+
+# # # # # # # # # # # #
+#   INDEXES           #
+# # # # # # # # # # # #
+
+# The query index is built once from the cleaned games and every lookup only touches the rows it
+# returns. Each criterion finds its matching rows without a scan:
+# - Developer, Publisher, Genre, Platform and Age Rating: a hash index, a dict from every value to
+#   the positions of its rows, next to an integer code per row.
+# - Release Date: the positions sorted by release date, a date range is two binary searches.
+# - Title: the positions sorted by case folded title, a prefix is two binary searches over the
+#   sorted titles, the same rows a trie would walk to, plus the rank of every row in that order.
+# A query starts from the criterion with the fewest rows and checks the other criteria on those
+# rows only, through the codes, dates and ranks, so its cost follows the rows it matches, not the
+# size of the dataset.
+
+# the columns with a hash index
+HASH_INDEX_COLUMNS = ['Developer', 'Publisher', 'Genre', 'Platform', 'Age Rating']
+
+# sorts after every character, closes the range of titles that start with a prefix
+PREFIX_END = '\U0010ffff'
+
+# the positions of the rows of every value of a column, and the code of every row
+def build_hash_index(values):
+    codes, labels = pd.factorize(values)
+    order = np.argsort(codes, kind='stable')
+    boundaries = np.cumsum(np.bincount(codes[codes >= 0], minlength=len(labels)))[:-1]
+    positions = np.split(order[np.count_nonzero(codes < 0):], boundaries)
+    return {
+        'codes': codes,
+        'codes by value': {label: code for code, label in enumerate(labels)},
+        'positions': positions,
+    }
+
+# build the hash, release date and title indexes of the cleaned games
+def build_query_index(df):
+    logging.info("'build query index' started.")
+    games = df.reset_index(drop=True)
+
+    hash_indexes = {column: build_hash_index(games[column].to_numpy(dtype=object)) for column in HASH_INDEX_COLUMNS}
+
+    release_dates = pd.to_datetime(games['Release Date'], format=vg.RELEASE_DATE_FORMAT).to_numpy(dtype='datetime64[D]')
+    release_date_order = np.argsort(release_dates, kind='stable')
+
+    titles = games['Title'].str.casefold().to_numpy(dtype=object)
+    title_order = np.argsort(titles, kind='stable')
+    title_ranks = np.empty(len(titles), dtype='int64')
+    title_ranks[title_order] = np.arange(len(titles))
+
+    query_index = {
+        'games': games,
+        # numpy object columns take a few rows without copying the whole column, unlike arrow backed strings
+        'columns': {column: games[column].to_numpy(dtype=object) for column in games.columns},
+        'hash indexes': hash_indexes,
+        'release dates': release_dates,
+        'release date order': release_date_order,
+        'sorted release dates': release_dates[release_date_order],
+        'title order': title_order,
+        'sorted titles': titles[title_order],
+        'title ranks': title_ranks,
+    }
+    logging.info(f"'build query index' completed, {len(games)} games.")
+    return query_index
+
+# read a cleaned csv and index it
+def load_query_index(cleaned_csv):
+    logging.info(f"'load query index' {cleaned_csv} started.")
+    df = pd.read_csv(cleaned_csv, dtype=str, keep_default_na=False)
+    query_index = build_query_index(df)
+    logging.info("'load query index' completed.")
+    return query_index
+
+# # # # # # # # # # # #
+#   QUERIES           #
+# # # # # # # # # # # #
+
+# the rows of one or more values of a hash indexed column, and a check of the column on other rows
+def hash_criterion(hash_index, values):
+    values = dict.fromkeys(values if isinstance(values, list) else [values])
+    codes = [hash_index['codes by value'][value] for value in values if value in hash_index['codes by value']]
+    positions = np.concatenate([hash_index['positions'][code] for code in codes]) if codes else np.array([], dtype='int64')
+    return positions, lambda candidates: np.isin(hash_index['codes'][candidates], codes)
+
+# the rows released between released_from and released_to, both included when given, and a check of
+# the release date on other rows
+def release_date_criterion(query_index, released_from, released_to):
+    lowest = np.datetime64(pd.Timestamp(released_from), 'D') if released_from is not None else np.datetime64('0001-01-01')
+    highest = np.datetime64(pd.Timestamp(released_to), 'D') if released_to is not None else np.datetime64('9999-12-31')
+    start = np.searchsorted(query_index['sorted release dates'], lowest, side='left')
+    end = np.searchsorted(query_index['sorted release dates'], highest, side='right')
+    release_dates = query_index['release dates']
+    return query_index['release date order'][start:end], lambda candidates: (release_dates[candidates] >= lowest) & (release_dates[candidates] <= highest)
+
+# the rows whose title starts with prefix, ignoring case, and a check of the title on other rows
+def title_prefix_criterion(query_index, prefix):
+    prefix = prefix.casefold()
+    start = np.searchsorted(query_index['sorted titles'], prefix, side='left')
+    end = np.searchsorted(query_index['sorted titles'], prefix + PREFIX_END, side='left')
+    title_ranks = query_index['title ranks']
+    return query_index['title order'][start:end], lambda candidates: (title_ranks[candidates] >= start) & (title_ranks[candidates] < end)
+
+# the games matching every given criterion, in the order of the cleaned csv and at most limit of
+# them, a hash indexed criterion takes one value or a list of values
+def query_games(query_index, developer=None, publisher=None, genre=None, platform=None, age_rating=None,
+                released_from=None, released_to=None, title_prefix=None, limit=None):
+    criteria = []
+    for column, values in zip(HASH_INDEX_COLUMNS, [developer, publisher, genre, platform, age_rating]):
+        if values is not None:
+            criteria.append(hash_criterion(query_index['hash indexes'][column], values))
+    if released_from is not None or released_to is not None:
+        criteria.append(release_date_criterion(query_index, released_from, released_to))
+    if title_prefix is not None:
+        criteria.append(title_prefix_criterion(query_index, title_prefix))
+
+    if not criteria:
+        games = query_index['games']
+        return games if limit is None else games.head(limit)
+
+    # the criterion with the fewest rows gives the candidates, the others only check them
+    criteria.sort(key=lambda criterion: len(criterion[0]))
+    candidates = criteria[0][0]
+    for _, check in criteria[1:]:
+        candidates = candidates[check(candidates)]
+
+    candidates = np.sort(candidates)
+    if limit is not None:
+        candidates = candidates[:limit]
+    games = pd.DataFrame({column: values[candidates] for column, values in query_index['columns'].items()}, index=candidates)
+    return games.astype(query_index['games'].dtypes.to_dict())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up games in a cleaned video games csv.")
+    parser.add_argument('cleaned_csv', help="a cleaned csv written by video_games_access.py")
+    parser.add_argument('--developer', action='append', help="a developer, can be given more than once")
+    parser.add_argument('--publisher', action='append', help="a publisher, can be given more than once")
+    parser.add_argument('--genre', action='append', help="a genre, can be given more than once")
+    parser.add_argument('--platform', action='append', help="a platform, can be given more than once")
+    parser.add_argument('--age-rating', action='append', help="an age rating, can be given more than once")
+    parser.add_argument('--released-from', help="the first release date, e.g. 2010-01-01")
+    parser.add_argument('--released-to', help="the last release date, e.g. 2010-12-31")
+    parser.add_argument('--title-prefix', help="the start of the title, ignoring case")
+    parser.add_argument('--limit', type=int, default=None, help="the most games to print")
+    args = parser.parse_args()
+
+    query_index = load_query_index(args.cleaned_csv)
+    games = query_games(query_index, args.developer, args.publisher, args.genre, args.platform, args.age_rating,
+                        args.released_from, args.released_to, args.title_prefix, args.limit)
+    print(games.to_string(index=False))
+    sys.exit(0 if len(games) else 1)
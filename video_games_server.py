@@ -0,0 +1,203 @@
+import video_games as vg
+
+import pandas as pd
+import os
+import io
+import json
+import argparse
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+# # # # # # # # # # # #
+#   SETTINGS          #
+# # # # # # # # # # # #
+
+# the dimensions served, by the name used in the urls
+DIMENSIONS = {
+    'release-date': 'Release Period',
+    'developer': 'Developer',
+    'publisher': 'Publisher',
+    'genre': 'Genre',
+    'age-rating': 'Age Rating',
+    'platform': 'Platform',
+}
+
+# the charts served, by the name used in the urls, e.g. release_date_year_bar_chart is release-date-year
+CHARTS = {chart.__name__.rsplit('_', 2)[0].replace('_', '-'): (chart, column, top_bottom) for chart, column, top_bottom in vg.CHARTS}
+
+# the longest request line and headers read from a client
+MAX_REQUEST_BYTES = 64 * 1024
+
+STATUS_TEXT = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+# # # # # # # # # # # #
+#   DATASET           #
+# # # # # # # # # # # #
+
+# what changes when the csv file is written again
+def file_signature(file_name):
+    file_stat = os.stat(file_name)
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+# clean the csv file, or read the cleaned dataframe from the cache of an earlier run, and count it,
+# runs in a worker process so the event loop keeps answering
+def load_frequency_tables(file_name):
+    logging.info(f"'load frequency tables' {file_name} started.")
+    cache_file = vg.get_cache_file(file_name)
+    if cache_file and os.path.isfile(cache_file):
+        df = pd.read_feather(cache_file)
+    else:
+        df = pd.read_csv(file_name, dtype=vg.CSV_DTYPES)
+        # the server writes no report, the cleaning sections are kept in memory and dropped
+        df, _ = vg.clean_games(df, report={'txt': io.StringIO(), 'ndjson': io.StringIO()})
+    vg.normalize_release_date(df)
+    frequency_tables = vg.build_frequency_tables(df)
+    logging.info("'load frequency tables' completed.")
+    return frequency_tables
+
+# # # # # # # # # # # #
+#   RESPONSES         #
+# # # # # # # # # # # #
+
+# a json response
+def json_response(value):
+    return 200, 'application/json', json.dumps(value).encode()
+
+# the counts of a frequency table, most first, as a list so the order survives any json client
+def counts_response(value_counts):
+    return json_response([{'value': str(value), 'games': int(games)} for value, games in value_counts.items()])
+
+# the counts of a dimension, the release dates by month name like the report
+def dimension_counts(frequency_tables, column):
+    if column == 'Release Period':
+        return vg.get_release_month_counts(frequency_tables)
+    return vg.get_value_counts(frequency_tables, column)
+
+# the response to a path, run in the event loop for the json endpoints and in the executor for the charts
+async def build_response(server, path):
+    frequency_tables = server['frequency tables']
+    parts = path.strip('/').split('/')
+
+    if parts == ['']:
+        return json_response({
+            'endpoints': ['/total', '/counts/<dimension>', '/most-common/<dimension>', '/least-common/<dimension>', '/charts/<chart>.png'],
+            'dimensions': list(DIMENSIONS),
+            'charts': list(CHARTS),
+        })
+    if parts == ['total']:
+        return json_response({'games': int(vg.get_value_counts(frequency_tables, 'Release Period').sum())})
+    if len(parts) == 2 and parts[0] in ('counts', 'most-common', 'least-common') and parts[1] in DIMENSIONS:
+        value_counts = dimension_counts(frequency_tables, DIMENSIONS[parts[1]])
+        if parts[0] == 'counts':
+            return counts_response(value_counts)
+        value = vg.most_common_value(value_counts) if parts[0] == 'most-common' else vg.least_common_value(value_counts)
+        return json_response({'value': str(value), 'games': int(value_counts[value])})
+    if len(parts) == 2 and parts[0] == 'charts' and parts[1].endswith('.png') and parts[1][:-4] in CHARTS:
+        chart, column, top_bottom = CHARTS[parts[1][:-4]]
+        (_, chart_table), = vg.chart_tables(frequency_tables, [(chart, column, top_bottom)])
+        loop = asyncio.get_running_loop()
+        png = await loop.run_in_executor(server['executor'], vg.render_chart_png, chart, chart_table, server['fast charts'])
+        return 200, 'image/png', png
+    return 404, 'application/json', json.dumps({'error': f"no such path '{path}'"}).encode()
+
+# # # # # # # # # # # #
+#   SERVER            #
+# # # # # # # # # # # #
+
+# load the dataset again when the csv file changed since it was loaded, which also empties the cache
+async def refresh_dataset(server):
+    signature = file_signature(server['file name'])
+    async with server['lock']:
+        if signature == server['signature']:
+            return
+        logging.info(f"'refresh dataset' {server['file name']} changed, loading it again.")
+        loop = asyncio.get_running_loop()
+        server['frequency tables'] = await loop.run_in_executor(server['executor'], load_frequency_tables, server['file name'])
+        server['signature'] = signature
+        server['cache'] = {}
+
+# the cached response to a path, requests for a path already being built wait for the same result,
+# only successful responses are kept
+async def cached_response(server, path):
+    cache = server['cache']
+    if path not in cache:
+        cache[path] = asyncio.ensure_future(build_response(server, path))
+    try:
+        response = await cache[path]
+    except Exception:
+        cache.pop(path, None)
+        raise
+    if response[0] != 200:
+        cache.pop(path, None)
+    return response
+
+# write a response and close the connection
+async def send_response(writer, status, content_type, body):
+    writer.write(
+        f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    writer.close()
+
+# answer one http request
+async def handle_request(server, reader, writer):
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+        method, target, _ = request.split(b"\r\n", 1)[0].decode('latin-1').split(' ', 2)
+        if method != 'GET':
+            await send_response(writer, 405, 'application/json', json.dumps({'error': 'only GET is supported'}).encode())
+            return
+        path = target.split('?', 1)[0]
+        await refresh_dataset(server)
+        status, content_type, body = await cached_response(server, path)
+        await send_response(writer, status, content_type, body)
+        logging.info(f"'handle request' GET {path} {status}.")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+        writer.close()
+    except Exception as e:
+        logging.error(f"An unexpected {type(e).__name__} error occurred: {e}")
+        await send_response(writer, 500, 'application/json', json.dumps({'error': f"{type(e).__name__}: {e}"}).encode())
+
+# load the dataset once and answer requests until stopped
+async def serve(file_name, host, port, workers=None, fast_charts=False):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        server = {
+            'file name': file_name,
+            'signature': None,
+            'frequency tables': None,
+            'cache': {},
+            'lock': asyncio.Lock(),
+            'executor': executor,
+            'fast charts': fast_charts,
+        }
+        await refresh_dataset(server)
+
+        http_server = await asyncio.start_server(lambda reader, writer: handle_request(server, reader, writer), host, port, limit=MAX_REQUEST_BYTES)
+        logging.info(f"'serve' listening on http://{host}:{port}.")
+        print(f"Serving {file_name} on http://{host}:{port}, press Ctrl+C to stop.")
+        async with http_server:
+            await http_server.serve_forever()
+
+def run_video_games_server(file_name, host='127.0.0.1', port=8000, workers=None, fast_charts=False):
+    log_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log")
+    os.makedirs(log_directory, exist_ok=True)
+    vg.setup_logging(os.path.join(log_directory, f"{os.path.splitext(os.path.basename(file_name))[0]}_server.log"))
+    vg.check_csv_file(file_name)
+    try:
+        asyncio.run(serve(file_name, host, port, workers, fast_charts))
+    except KeyboardInterrupt:
+        logging.info("'video games server' stopped.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the video games counts and charts over http.")
+    parser.add_argument('file_name', help="the video games csv file")
+    parser.add_argument('--host', default='127.0.0.1', help="the address to listen on, localhost by default")
+    parser.add_argument('--port', type=int, default=8000, help="the port to listen on")
+    parser.add_argument('--workers', type=int, default=None, help="processes that clean the data and draw the charts, the number of cpus by default")
+    parser.add_argument('--fast-charts', action='store_true', help="draw the charts with the fast settings")
+    args = parser.parse_args()
+    run_video_games_server(args.file_name, args.host, args.port, args.workers, args.fast_charts)